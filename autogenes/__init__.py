@@ -36,6 +36,23 @@ def get_pos_muts(block_id):
         0 if tokens[1] == 'wt' else (tokens[1].count('&') + 1)
 
 
+def get_pool_id(pos, muts, generation=1):
+    '''Get id of the pool of blocks at a position with a number of
+    mutations. Blocks added to a library after its pools were made are
+    pooled in a later generation.'''
+    return str(pos) + '_' + (str(muts) if muts > 0 else 'wt') + \
+        ('.' + str(generation) if generation > 1 else '') + '_p'
+
+
+def get_pool_pos_muts(pool_id):
+    '''Parse pool id to get position, number of mutations and
+    generation.'''
+    tokens = pool_id.split('_')
+    muts, _, generation = tokens[1].partition('.')
+    return int(tokens[0]), 0 if muts == 'wt' else int(muts), \
+        int(generation) if generation else 1
+
+
 def get_primers(designs):
     '''Get primers.'''
     primers = [[block[0], block[-1]]
@@ -0,0 +1,47 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+from functools import partial
+
+from autogenes import serpentine_opt, smart_sort_opt
+import numpy as np
+
+_CANDIDATES = [partial(smart_sort_opt.optimise, by_src=False),
+               partial(smart_sort_opt.optimise, by_src=True),
+               partial(serpentine_opt.optimise, by_src=False),
+               partial(serpentine_opt.optimise, by_src=True)]
+
+
+def optimise(df):
+    '''Optimise, picking whichever candidate ordering has least travel.'''
+    best_df = None
+    best_travel = float('inf')
+
+    for candidate in _CANDIDATES:
+        candidate_df = candidate(df)
+        travel = get_travel(candidate_df)
+
+        if travel < best_travel:
+            best_df = candidate_df
+            best_travel = travel
+
+    return best_df
+
+
+def get_travel(df):
+    '''Estimate head travel, in wells, between consecutive source wells
+    and consecutive destination wells.'''
+    travel = 0
+
+    for prefix in ['src_', 'dest_']:
+        coords = df[[prefix + 'row', prefix + 'col']].values.astype(int)
+        travel += int(np.abs(np.diff(coords, axis=0)).sum())
+
+    return travel
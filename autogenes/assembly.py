@@ -0,0 +1,159 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+from collections import defaultdict
+import gzip
+
+from autogenes import get_block_id, get_design_id
+
+_IUPAC = {'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T',
+          'R': 'AG', 'Y': 'CT', 'S': 'CG', 'W': 'AT', 'K': 'GT', 'M': 'AC',
+          'B': 'CGT', 'D': 'AGT', 'H': 'ACT', 'V': 'ACG', 'N': 'ACGT'}
+
+_IUPAC_CODES = {frozenset(bases): code for code, bases in _IUPAC.items()}
+
+_COMPLEMENT = str.maketrans('ACGTRYSWKMBDHVN', 'TGCAYRSWMKVHDBN')
+
+
+class Assembler():
+    '''Class to assemble full length variant sequences from oligos.
+
+    Oligos are oriented once, following the wild-type order, taking each as
+    given or reverse complemented, whichever overlaps its predecessor more.
+    Mutant oligo pools are represented by their IUPAC consensus.'''
+
+    def __init__(self, oligos, seqs, mutant_seqs, min_overlap=10):
+        self.__min_overlap = min_overlap
+        self.__seqs = {}
+        self.__overlaps = {}
+        self.__blocks = {}
+
+        for idx, oligo_id in enumerate(oligos):
+            seq = seqs[oligo_id].upper()
+
+            if idx and self.__get_overlap(self.__seqs[oligos[idx - 1]],
+                                          reverse_complement(seq)) > \
+                    self.__get_overlap(self.__seqs[oligos[idx - 1]], seq):
+                self.__seqs[oligo_id] = reverse_complement(seq)
+
+                if oligo_id in mutant_seqs:
+                    self.__seqs[oligo_id + 'm'] = reverse_complement(
+                        get_consensus(mutant_seqs[oligo_id]))
+            else:
+                self.__seqs[oligo_id] = seq
+
+                if oligo_id in mutant_seqs:
+                    self.__seqs[oligo_id + 'm'] = get_consensus(
+                        mutant_seqs[oligo_id])
+
+    def get_seqs(self):
+        '''Get oriented sequences by oligo id, with mutant pools as the
+        parent id suffixed with m.'''
+        return dict(self.__seqs)
+
+    def get_sequence(self, design):
+        '''Get full length sequence of design.'''
+        return self.__join([self.__get_block(block_idx, block)
+                            for block_idx, block in enumerate(design)])[1]
+
+    def __get_block(self, block_idx, block):
+        '''Get (first oligo, sequence, last oligo) of block, cached by id.'''
+        block_id = get_block_id(block_idx, block)
+
+        if block_id not in self.__blocks:
+            self.__blocks[block_id] = \
+                self.__join([(oligo_id, self.__seqs[oligo_id], oligo_id)
+                             for oligo_id in block])
+
+        return self.__blocks[block_id]
+
+    def __join(self, frags):
+        '''Join (first oligo, sequence, last oligo) fragments, taking the
+        consensus of overlapping bases, such that mutations in either are
+        kept.'''
+        seq = frags[0][1]
+
+        for prev, frag in zip(frags, frags[1:]):
+            key = (prev[2], frag[0])
+
+            if key not in self.__overlaps:
+                overlap = self.__get_overlap(self.__seqs[prev[2]],
+                                             self.__seqs[frag[0]])
+
+                if overlap < self.__min_overlap:
+                    raise ValueError('No overlap between oligos %s and %s' %
+                                     key)
+
+                self.__overlaps[key] = overlap
+
+            start = len(seq) - self.__overlaps[key]
+            seq = seq[:start] + \
+                get_consensus([seq[start:],
+                               frag[1][:self.__overlaps[key]]]) + \
+                frag[1][self.__overlaps[key]:]
+
+        return frags[0][0], seq, frags[-1][2]
+
+    def __get_overlap(self, seq, nxt):
+        '''Get length of longest compatible suffix of seq and prefix of nxt.'''
+        return get_overlap(seq, nxt, self.__min_overlap)
+
+
+def get_sequences(input_plates):
+    '''Get wild-type sequences by id and mutant sequences by parent.'''
+    seqs = {obj['id']: obj['Sequence']
+            for obj in input_plates['wt'].get_all().values()
+            if 'Sequence' in obj}
+
+    mutant_seqs = defaultdict(list)
+
+    for obj in input_plates['mut'].get_all().values():
+        mutant_seqs[obj['parent']].append(obj['Sequence'].upper())
+
+    return seqs, mutant_seqs
+
+
+def get_overlap(seq, nxt, min_overlap=1):
+    '''Get length of longest compatible suffix of seq and prefix of nxt, or
+    0 if shorter than min_overlap.'''
+    for length in range(min(len(seq), len(nxt)), min_overlap - 1, -1):
+        if all(set(_IUPAC[a]) & set(_IUPAC[b])
+               for a, b in zip(seq[-length:], nxt[:length])):
+            return length
+
+    return 0
+
+
+def get_consensus(seqs):
+    '''Get IUPAC consensus of equal length sequences.'''
+    if len({len(seq) for seq in seqs}) > 1:
+        raise ValueError('Sequences differ in length: %s' %
+                         ', '.join(sorted({str(len(seq)) for seq in seqs})))
+
+    return ''.join(_IUPAC_CODES[frozenset(''.join(_IUPAC[base]
+                                                  for base in bases))]
+                   for bases in zip(*seqs))
+
+
+def reverse_complement(seq):
+    '''Get reverse complement, including IUPAC codes.'''
+    return seq.translate(_COMPLEMENT)[::-1]
+
+
+def write_fasta(designs, assembler, filename, line_len=80):
+    '''Stream designs to (gzipped, if filename ends .gz) FASTA.'''
+    opener = gzip.open if filename.endswith('.gz') else open
+
+    with opener(filename, 'wt') as fle:
+        for design in designs:
+            seq = assembler.get_sequence(design)
+            fle.write('>%s\n' % get_design_id(design))
+
+            for idx in range(0, len(seq), line_len):
+                fle.write(seq[idx:idx + line_len] + '\n')
@@ -0,0 +1,189 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=protected-access
+import os
+import sys
+import time
+
+from autogenes import adaptive_opt, design, diff, optimisers, plate, run, \
+    simulate, worklist
+from autogenes.typed_worklist import TypedWorklist
+import numpy as np
+import pandas as pd
+
+
+def bench_designs(n_oligos=60, n_mutable=40, max_mutated=4):
+    '''Benchmark sharded design enumeration against serial _combine.'''
+    oligos, mutant_oligos = _get_oligos(n_oligos, n_mutable)
+
+    start = time.time()
+    expected = run._combine(oligos, mutant_oligos, max_mutated, 3)
+    serial = time.time() - start
+    print('designs: %d\tserial: %.3fs' % (len(expected), serial))
+
+    for n_procs in [1, 2, 4, 8]:
+        if n_procs > (os.cpu_count() or 1):
+            break
+
+        start = time.time()
+        designs = list(design.iter_designs(oligos, list(mutant_oligos),
+                                           max_mutated, 3, n_procs))
+        elapsed = time.time() - start
+        assert designs == expected
+
+        print('procs: %d\t%.3fs\tspeedup: %.2f' %
+              (n_procs, elapsed, serial / elapsed))
+
+
+def bench_optimisers(n_transfers=2000, n_dest_plates=4, seed=0):
+    '''Benchmark compute time and head travel of optimisers on a synthetic
+    stage.'''
+    df = _get_stage(n_transfers, n_dest_plates, seed)
+
+    for name, optimiser in sorted(optimisers.OPTIMISERS.items()):
+        start = time.time()
+        optimised_df = worklist.optimise(df, optimiser)
+        elapsed = time.time() - start
+
+        print('%s\t%.3fs\ttravel: %d\tsimulated: %.0fs' %
+              (name, elapsed, adaptive_opt.get_travel(optimised_df),
+               simulate.simulate(optimised_df)['time'].sum()))
+
+
+def bench_parallel(n_transfers=200000, n_dest_plates=16, seed=0):
+    '''Benchmark parallel optimisation of a synthetic stage against
+    serial.'''
+    df = _get_stage(n_transfers, n_dest_plates, seed)
+
+    start = time.time()
+    expected = worklist.optimise(df, parallel_threshold=None)
+    serial = time.time() - start
+    print('transfers: %d\tserial: %.3fs' % (n_transfers, serial))
+
+    for n_procs in [2, 4, 8]:
+        start = time.time()
+        optimised_df = worklist.optimise(df, parallel_threshold=0,
+                                         n_procs=n_procs)
+        elapsed = time.time() - start
+        assert optimised_df.equals(expected)
+
+        print('procs: %d\t%.3fs\tspeedup: %.2f' %
+              (n_procs, elapsed, serial / elapsed))
+
+        if n_procs >= (os.cpu_count() or 1):
+            break
+
+
+def bench_typed(n_transfers=100000, n_dest_plates=100, seed=0):
+    '''Benchmark memory of typed worklists against DataFrames.'''
+    df = _get_stage(n_transfers, n_dest_plates, seed)
+
+    for prefix in ['src_', 'dest_']:
+        df[prefix + 'well'] = plate.get_well_names(df[prefix + 'row'],
+                                                   df[prefix + 'col'])
+
+    df['dest_name'] = ['design_%d' % idx for idx in range(n_transfers)]
+    df['src_name'] = df['src_name'].astype(object)
+
+    start = time.time()
+    typed = TypedWorklist(df)
+    encode = time.time() - start
+
+    start = time.time()
+    decoded = typed.to_df()
+    decode = time.time() - start
+
+    pd.testing.assert_frame_equal(decoded, df)
+
+    df_bytes = df.memory_usage(deep=True).sum()
+
+    print('transfers: %d\tDataFrame: %.1f MB\ttyped: %.1f MB\t'
+          'reduction: %.1fx\tencode: %.3fs\tdecode: %.3fs' %
+          (n_transfers, df_bytes / 1e6, typed.nbytes() / 1e6,
+           df_bytes / typed.nbytes(), encode, decode))
+
+
+def bench_simulate(n_transfers=1000000, n_dest_plates=100, seed=0):
+    '''Benchmark simulation of a synthetic stage.'''
+    df = _get_stage(n_transfers, n_dest_plates, seed)
+
+    start = time.time()
+    report = simulate.simulate(df)
+    print('transfers: %d\tsimulated: %.0fs\tcompute: %.3fs' %
+          (n_transfers, report['time'].sum(), time.time() - start))
+
+
+def bench_diff(n_transfers=1000000, n_changed=1000, seed=0):
+    '''Benchmark diff of a synthetic stage with a changed copy.'''
+    df = worklist.format_df(_get_stage(n_transfers, 100, seed))
+    df['ComponentName'] = df['ComponentName'] + \
+        (df.index % 1000).astype(str)
+    df['SourcePlateWell'] = plate.get_well_names(df['src_row'],
+                                                 df['src_col'])
+    df['DestinationPlateWell'] = plate.get_well_names(df['dest_row'],
+                                                      df['dest_col'])
+    df['dest_name'] = df.index.astype(str)
+
+    changed_df = df.sample(frac=1, random_state=seed)
+    changed_df.iloc[:n_changed, changed_df.columns.get_loc('Volume')] = 2.0
+
+    start = time.time()
+    counts = diff.diff(df, changed_df, diff._WORKLIST_TIERS)
+    print('transfers: %d\t%s\tcompute: %.3fs' %
+          (n_transfers, dict(counts), time.time() - start))
+
+
+def _get_oligos(n_oligos, n_mutable):
+    '''Get synthetic oligos and mutant oligos.'''
+    oligos = [str(idx + 1) for idx in range(n_oligos)]
+    mutant_oligos = {oligo: [oligo + '_1'] for oligo in oligos[:n_mutable]}
+    return oligos, mutant_oligos
+
+
+def _get_stage(n_transfers, n_dest_plates, seed, shape=(8, 12)):
+    '''Get synthetic stage of transfers between 96 well plates.'''
+    rng = np.random.RandomState(seed)
+    rows, cols = shape
+    is_reagent = rng.rand(n_transfers) < 0.25
+    src_idx = rng.randint(rows * cols, size=n_transfers)
+    dest_idx = rng.randint(rows * cols, size=n_transfers)
+
+    return pd.DataFrame({
+        'level': 0,
+        'src_is_reagent': is_reagent,
+        'src_name': np.where(is_reagent, 'mm', 'oligo'),
+        'src_plate': np.where(is_reagent, 'reagents', 'input'),
+        'src_idx': src_idx,
+        'src_row': src_idx % rows,
+        'src_col': src_idx // rows,
+        'src_plate_size': rows * cols,
+        'dest_plate': ['output~%d' % (idx % n_dest_plates)
+                       for idx in range(n_transfers)],
+        'dest_idx': dest_idx,
+        'dest_row': dest_idx % rows,
+        'dest_col': dest_idx // rows,
+        'Volume': 1.0})
+
+
+_BENCHMARKS = {'designs': bench_designs,
+               'diff': bench_diff,
+               'optimisers': bench_optimisers,
+               'parallel': bench_parallel,
+               'simulate': bench_simulate,
+               'typed': bench_typed}
+
+
+def main(args):
+    '''main method.'''
+    _BENCHMARKS[args[0]](*[int(arg) for arg in args[1:]])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -11,9 +11,11 @@ To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
 # pylint: disable=too-many-arguments
 from collections import Counter
 
-from autogenes import get_dil_oligo_id, get_block_id, get_pos_muts
-from autogenes.graph_writer import GraphWriter
+from autogenes import get_dil_oligo_id, get_block_id, get_pool_id, \
+    get_pool_pos_muts, get_pos_muts
+from autogenes.graph_writer import GraphWriter, get_vol_violations
 from autogenes.pcr import PcrWriter
+from autogenes.volume import Volume
 
 
 class InnerBlockPoolWriter(GraphWriter):
@@ -21,10 +23,16 @@ class InnerBlockPoolWriter(GraphWriter):
 
     def __init__(self, designs, wt_oligo_vol, mut_oligo_vol, output_name):
         self.__designs = designs
-        self.__wt_oligo_vol = wt_oligo_vol
-        self.__mut_oligo_vol = mut_oligo_vol
+        self.__wt_oligo_vol = Volume.from_ul(wt_oligo_vol)
+        self.__mut_oligo_vol = Volume.from_ul(mut_oligo_vol)
         GraphWriter.__init__(self, output_name)
 
+    def get_violations(self, min_vol):
+        return get_vol_violations('Oligo',
+                                  [self.__wt_oligo_vol.to_ul(),
+                                   self.__mut_oligo_vol.to_ul()],
+                                  [self.get_output_name()] * 2, min_vol)
+
     def _initialise(self):
         block_ids = []
 
@@ -44,9 +52,11 @@ class InnerBlockPoolWriter(GraphWriter):
                         oligo = self._add_vertex(dil_id,
                                                  {'is_reagent': False})
 
+                        vol = self.__mut_oligo_vol \
+                            if is_mut else self.__wt_oligo_vol
+
                         self._add_edge(oligo, inner_pool,
-                                       {'Volume': self.__mut_oligo_vol
-                                        if is_mut else self.__wt_oligo_vol})
+                                       {'Volume': vol.to_ul()})
 
                     block_ids.append(block_id)
 
@@ -60,8 +70,8 @@ class BlockPcrWriter(PcrWriter):
         PcrWriter.__init__(self, comps_vol, wt_primer_vol, mut_primer_vol,
                            total_vol, output_name)
 
-    def _initialise(self):
-        block_ids = []
+    def _get_reactions(self):
+        block_ids = set()
 
         for design in self.__designs:
             for block_idx, block in enumerate(design):
@@ -73,41 +83,91 @@ class BlockPcrWriter(PcrWriter):
                     primer_ids = [get_dil_oligo_id(block[idx])
                                   for idx in [0, -1]]
 
-                    self._add_pcr(pcr_id, pcr_comps_ids, primer_ids)
+                    yield pcr_id, pcr_comps_ids, primer_ids
 
-                block_ids.append(block_id)
+                block_ids.add(block_id)
 
 
 class BlockPoolWriter(GraphWriter):
-    '''Class for generating pooled block worklist graphs.'''
+    '''Class for generating pooled block worklist graphs.
+
+    If pools, the block PCRs of each pool of a run being extended, are
+    given, only other block PCRs are pooled, into new pools (see
+    get_pools).'''
 
-    def __init__(self, designs, min_vol, max_vol, is_mut, output_name):
+    def __init__(self, designs, min_vol, max_vol, is_mut, output_name,
+                 pools=None):
         self.__designs = designs
-        self.__min_vol = min_vol
-        self.__max_vol = max_vol
+        self.__min_vol = Volume.from_ul(min_vol)
+        self.__max_vol = Volume.from_ul(max_vol)
         self.__is_mut = is_mut
+        self.__pools = pools if pools else {}
         GraphWriter.__init__(self, output_name)
 
-    def _initialise(self):
-        pool_steps = {}
+    def get_violations(self, min_vol):
+        transfers = self.__get_transfers()
 
-        for design in self.__designs:
-            for block_idx, block in enumerate(design):
-                block_id = get_block_id(block_idx, block)
-                pcr_id = block_id + '_b'
-                pool_id = '_'.join([str(val) if val > 0 else 'wt'
-                                    for val in get_pos_muts(block_id)]) + '_p'
+        return get_vol_violations('Block pool',
+                                  [transfer[2].to_ul()
+                                   for transfer in transfers],
+                                  [transfer[0] for transfer in transfers],
+                                  min_vol)
+
+    def _initialise(self):
+        for pcr_id, pool_id, vol in self.__get_transfers():
+            pcr = self._add_vertex(pcr_id, {'is_reagent': False})
+            pool = self._add_vertex(pool_id, {'is_reagent': False})
+            self._add_edge(pcr, pool, {'Volume': vol.to_ul()})
 
-                pool_steps[pcr_id] = pool_id
+    def __get_transfers(self):
+        '''Get (pcr_id, pool_id, volume) of each transfer.'''
+        pool_steps = get_pools(self.__designs, self.__pools)
+        transfers = []
 
+        # Pools of a run being extended count towards the largest pool:
         pool_counter = Counter(list(pool_steps.values()))
-        max_pool_vol = pool_counter.most_common(1)[0][1] * self.__min_vol
+        max_pool_size = max(list(pool_counter.values()) +
+                            [len(pcr_ids)
+                             for pcr_ids in self.__pools.values()],
+                            default=0)
 
         for pcr_id, pool_id in pool_steps.items():
             if (self.__is_mut and 'wt' not in pool_id) \
                     or (not self.__is_mut and 'wt' in pool_id):
-                pcr = self._add_vertex(pcr_id, {'is_reagent': False})
-                pool = self._add_vertex(pool_id, {'is_reagent': False})
                 vol = min(self.__max_vol,
-                          (1 / pool_counter[pool_id] * max_pool_vol))
-                self._add_edge(pcr, pool, {'Volume': vol})
+                          self.__min_vol.scale(max_pool_size,
+                                               pool_counter[pool_id]))
+                transfers.append((pcr_id, pool_id, vol))
+
+        return transfers
+
+
+def get_pools(designs, pools=None):
+    '''Get pool of each block PCR, as {pcr_id: pool_id}, pooling block PCRs
+    by position and number of mutations.
+
+    If pools, the block PCRs of each pool of a run being extended, are
+    given, block PCRs already pooled are omitted, and others are pooled in
+    the next generation of any existing pool, as that has been used.'''
+    pooled = {pcr_id
+              for pcr_ids in (pools or {}).values()
+              for pcr_id in pcr_ids}
+    generations = Counter()
+
+    for pool_id in pools or {}:
+        pos, muts, generation = get_pool_pos_muts(pool_id)
+        generations[(pos, muts)] = max(generations[(pos, muts)], generation)
+
+    pool_steps = {}
+
+    for design in designs:
+        for block_idx, block in enumerate(design):
+            block_id = get_block_id(block_idx, block)
+            pcr_id = block_id + '_b'
+
+            if pcr_id not in pooled:
+                pos, muts = get_pos_muts(block_id)
+                pool_steps[pcr_id] = get_pool_id(
+                    pos, muts, generations[(pos, muts)] + 1)
+
+    return pool_steps
@@ -0,0 +1,102 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+from collections import defaultdict
+
+from synbiochem.utils.graph_utils import Graph
+
+
+class PipelineGraph(Graph):
+    '''Class to represent a whole pipeline as a single graph, with each edge
+    tagged by the stage whose writer added it.'''
+
+    def __init__(self):
+        Graph.__init__(self)
+        self.__stage = None
+        self.__stage_vertices = defaultdict(dict)
+        self.__stage_srcs = defaultdict(set)
+
+    def set_stage(self, stage):
+        '''Set stage to which subsequent vertices and edges belong.'''
+        self.__stage = stage
+
+    def get_stages(self):
+        '''Get stages, in the order written.'''
+        return list(self.__stage_vertices)
+
+    def get_view(self, stage):
+        '''Get view of a single stage.'''
+        return StageView(self, stage)
+
+    def get_stage_vertices(self, stage):
+        '''Get vertices used by a stage, in the order first used.'''
+        return list(self.__stage_vertices[stage].values())
+
+    def is_stage_src(self, stage, vertex):
+        '''Is vertex the source of an edge in stage?'''
+        return vertex.attributes()['name'] in self.__stage_srcs[stage]
+
+    def find_vertex(self, name):
+        vertex = Graph.find_vertex(self, name)
+        self.__stage_vertices[self.__stage].setdefault(name, vertex)
+        return vertex
+
+    def add_edge(self, vertex_from, vertex_to, attributes):
+        self.__stage_srcs[self.__stage].add(vertex_from.attributes()['name'])
+        Graph.add_edge(self, vertex_from, vertex_to,
+                       dict(attributes, stage=self.__stage))
+
+
+class StageView():
+    '''Class to view a single stage of a PipelineGraph as a graph.'''
+
+    def __init__(self, graph, stage):
+        self.__graph = graph
+        self.__stage = stage
+
+    def get_roots(self):
+        '''Get roots.'''
+        return [_VertexView(vertex, self.__stage)
+                for vertex in self.__graph.get_stage_vertices(self.__stage)
+                if not self.__graph.is_stage_src(self.__stage, vertex)]
+
+
+class _VertexView():
+    '''Class to view a vertex, with only the edges of a single stage.'''
+
+    def __init__(self, vertex, stage):
+        self.__vertex = vertex
+        self.__stage = stage
+
+    def predecessors(self):
+        '''Get predecessors in stage.'''
+        return [(_VertexView(src, self.__stage),
+                 {key: val for key, val in attributes.items()
+                  if key != 'stage'})
+                for src, attributes in self.__vertex.predecessors()
+                if attributes['stage'] == self.__stage]
+
+    def attributes(self):
+        '''Get attributes.'''
+        return self.__vertex.attributes()
+
+    def indegree(self):
+        '''Get indegree in stage.'''
+        return len(self.predecessors())
+
+    def __eq__(self, other):
+        return isinstance(other, _VertexView) and \
+            self.__vertex is other.__vertex and \
+            self.__stage == other.__stage
+
+    def __hash__(self):
+        return hash((id(self.__vertex), self.__stage))
+
+    def __repr__(self):
+        return repr(self.__vertex)
@@ -0,0 +1,353 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=too-many-arguments
+import itertools
+from math import comb
+from multiprocessing import Pool
+import random
+
+from autogenes import get_design_id
+
+
+def get_block_lengths(n_oligos, n_blocks):
+    '''Get lengths of blocks of almost equal, even length.'''
+    block_lengths = [0] * n_blocks
+
+    for idx in itertools.cycle(range(0, n_blocks)):
+        block_lengths[idx] = block_lengths[idx] + 2
+
+        if sum(block_lengths) == n_oligos:
+            break
+
+    return block_lengths
+
+
+def get_min_block_lengths(oligos, mutable, max_mutated, n_blocks):
+    '''Get lengths of n_blocks blocks of even length, minimising the number
+    of unique block PCRs over all designs.
+
+    Cut points are found by dynamic programming, with ties broken in favour
+    of blocks of more equal length, then of longer leading blocks, as in
+    get_block_lengths.'''
+    mutable = set(mutable)
+    prefix = [0] + list(itertools.accumulate(oligo in mutable
+                                             for oligo in oligos))
+
+    # Best (cost, lengths) of blocks ending at each cut point:
+    best = {0: ((0, 0, []), [])}
+
+    for block_idx in range(n_blocks):
+        remaining = n_blocks - block_idx - 1
+        nxt = {}
+
+        for start, (cost, lengths) in best.items():
+            for end in range(start + 2, len(oligos) - 2 * remaining + 1, 2):
+                length = end - start
+                n_mutable = prefix[end] - prefix[start]
+                new_cost = (cost[0] + get_n_designs(n_mutable, max_mutated),
+                            cost[1] + length ** 2,
+                            cost[2] + [-length])
+
+                if end not in nxt or new_cost < nxt[end][0]:
+                    nxt[end] = (new_cost, lengths + [length])
+
+        best = nxt
+
+    return best[len(oligos)][1]
+
+
+def get_n_block_pcrs(oligos, mutable, max_mutated, block_lengths):
+    '''Get number of unique block PCRs (and inner block pools) over all
+    designs.'''
+    mutable = set(mutable)
+
+    return sum(get_n_designs(sum(oligo in mutable for oligo in block),
+                             max_mutated)
+               for block in get_design(oligos, [], block_lengths))
+
+
+def get_design(oligos, combi, block_lengths, positions=None):
+    '''Get design, as blocks of oligos, mutating the oligos in combi.'''
+    if positions is None:
+        positions = {oligo: idx for idx, oligo in enumerate(oligos)}
+
+    design = list(oligos)
+
+    for wt_id in combi:
+        design[positions[wt_id]] = wt_id + 'm'
+
+    idx = 0
+    blocks = []
+
+    for val in block_lengths:
+        blocks.append(design[idx: idx + val])
+        idx = idx + val
+
+    return blocks
+
+
+def get_n_designs(n_mutable, max_mutated):
+    '''Get number of designs.'''
+    return sum(comb(n_mutable, n_mutated)
+               for n_mutated in range(max_mutated + 1))
+
+
+def unrank(rank, n, k):
+    '''Get the combination of k from range(n) at the given rank, in the
+    lexicographic order of itertools.combinations.'''
+    combi = []
+    val = 0
+
+    for idx in range(k):
+        while True:
+            count = comb(n - val - 1, k - idx - 1)
+
+            if rank < count:
+                break
+
+            rank -= count
+            val += 1
+
+        combi.append(val)
+        val += 1
+
+    return combi
+
+
+def iter_combinations(n, k, start, stop):
+    '''Iterate combinations of k from range(n) with ranks in [start, stop).'''
+    if start >= stop:
+        return
+
+    combi = unrank(start, n, k)
+
+    for _ in range(stop - start):
+        yield tuple(combi)
+
+        # Advance to lexicographic successor:
+        idx = k - 1
+
+        while idx >= 0 and combi[idx] == n - k + idx:
+            idx -= 1
+
+        if idx < 0:
+            return
+
+        combi[idx] += 1
+
+        for nxt in range(idx + 1, k):
+            combi[nxt] = combi[nxt - 1] + 1
+
+
+def get_shards(n_designs, n_shards):
+    '''Split design ranks into contiguous [start, stop) ranges.'''
+    n_shards = max(1, min(n_shards, n_designs))
+    bounds = [n_designs * idx // n_shards for idx in range(n_shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def get_shard(oligos, mutable, max_mutated, n_blocks, start, stop,
+              block_lengths=None):
+    '''Get designs with ranks in [start, stop).
+
+    Designs are ranked by number of mutated oligos, then lexicographically
+    by the combination of mutable oligos.'''
+    designs = []
+
+    if block_lengths is None:
+        block_lengths = get_block_lengths(len(oligos), n_blocks)
+
+    positions = {oligo: idx for idx, oligo in enumerate(oligos)}
+    offset = 0
+
+    for n_mutated in range(max_mutated + 1):
+        count = comb(len(mutable), n_mutated)
+        lower = max(start, offset) - offset
+        upper = min(stop, offset + count) - offset
+
+        for combi in iter_combinations(len(mutable), n_mutated,
+                                       lower, upper):
+            designs.append(get_design(oligos,
+                                      [mutable[idx] for idx in combi],
+                                      block_lengths,
+                                      positions))
+
+        offset += count
+
+    return designs
+
+
+def iter_designs(oligos, mutable, max_mutated, n_blocks, n_procs=1,
+                 shards_per_proc=4, block_lengths=None):
+    '''Iterate designs, generating disjoint shards in n_procs processes.
+
+    Shards are yielded in rank order, so designs are identical to serial
+    enumeration.'''
+    n_designs = get_n_designs(len(mutable), max_mutated)
+    args = [(oligos, mutable, max_mutated, n_blocks, start, stop,
+             block_lengths)
+            for start, stop in get_shards(n_designs,
+                                          n_procs * shards_per_proc)]
+
+    if n_procs < 2:
+        for arg in args:
+            yield from get_shard(*arg)
+        return
+
+    with Pool(n_procs) as pool:
+        for designs in pool.imap(_get_shard, args):
+            yield from designs
+
+
+def sample_designs(oligos, mutable, max_mutated, n_samples, block_lengths,
+                   seed=0):
+    '''Get a reproducible random sample of n_samples designs, without
+    enumerating all designs.
+
+    Samples are allocated to strata of designs with the same number of
+    mutated oligos, in proportion to their size, with at least one per
+    non-empty stratum while n_samples allows. Within each, designs are
+    ranked by the number of mutations in each block, in turn, and one design
+    is drawn from each of n equal slices of ranks, spreading mutations over
+    block positions in proportion.'''
+    rng = random.Random(seed)
+    positions = {oligo: idx for idx, oligo in enumerate(oligos)}
+    mutable = set(mutable)
+    block_mutable = [[oligo for oligo in block if oligo in mutable]
+                     for block in get_design(oligos, [], block_lengths,
+                                             positions)]
+    sizes = [comb(len(mutable), n_mutated)
+             for n_mutated in range(max_mutated + 1)]
+    designs = []
+
+    for n_mutated, (size, n_sample) in enumerate(
+            zip(sizes, _allocate(sizes, n_samples))):
+        for idx in range(n_sample):
+            lower = idx * size // n_sample
+            upper = (idx + 1) * size // n_sample
+            designs.append(get_design(
+                oligos,
+                _unrank_blocks(lower + rng.randrange(upper - lower),
+                               block_mutable, n_mutated),
+                block_lengths, positions))
+
+    return designs
+
+
+def get_new_designs(oligos, mutable, max_mutated, block_lengths, previous):
+    '''Get designs not in previous, the design ids of a run being extended.
+
+    If previous holds every design of up to some number of mutated oligos,
+    over the oligos mutated in any of them, only designs with more mutated
+    oligos, or mutating other oligos, are enumerated.'''
+    previous = set(previous)
+    prev_mutated = [_get_mutated(design_id) for design_id in previous]
+    prev_mutable = {oligo for mutated in prev_mutated for oligo in mutated}
+    prev_max = max([len(mutated) for mutated in prev_mutated], default=-1)
+
+    if len(previous) != get_n_designs(len(prev_mutable), prev_max):
+        # Not every design, e.g. a sample, so enumerate all:
+        prev_max = -1
+
+    old = [oligo for oligo in mutable if oligo in prev_mutable]
+    new = [oligo for oligo in mutable if oligo not in prev_mutable]
+    positions = {oligo: idx for idx, oligo in enumerate(oligos)}
+    designs = []
+
+    for n_mutated in range(max_mutated + 1):
+        if n_mutated > prev_max:
+            combis = itertools.combinations(mutable, n_mutated)
+        else:
+            # Combinations of at least one new oligo:
+            combis = (new_combi + old_combi
+                      for n_new in range(1, n_mutated + 1)
+                      for new_combi in itertools.combinations(new, n_new)
+                      for old_combi in itertools.combinations(
+                          old, n_mutated - n_new))
+
+        for combi in combis:
+            design = get_design(oligos, combi, block_lengths, positions)
+
+            if get_design_id(design) not in previous:
+                designs.append(design)
+
+    return designs
+
+
+def _get_mutated(design_id):
+    '''Parse design id to get mutated oligos.'''
+    return [oligo
+            for block_id in design_id.split('-')
+            for oligo in block_id.split('_', 1)[1].split('&')
+            if oligo != 'wt']
+
+
+def _unrank_blocks(rank, block_mutable, n_mutated):
+    '''Get the combination of n_mutated mutable oligos at the given rank,
+    ranked by number mutated in each block, then by combination within each
+    block.'''
+    combi = []
+    n_remaining = sum(len(muts) for muts in block_mutable)
+
+    for muts in block_mutable:
+        n_rest = n_remaining - len(muts)
+
+        for count in range(min(n_mutated, len(muts)) + 1):
+            # Designs with count mutations in this block:
+            n_rest_designs = comb(n_rest, n_mutated - count)
+            n_designs = comb(len(muts), count) * n_rest_designs
+
+            if rank < n_designs:
+                break
+
+            rank -= n_designs
+
+        block_rank, rank = divmod(rank, n_rest_designs)
+        combi.extend(muts[idx]
+                     for idx in unrank(block_rank, len(muts), count))
+        n_mutated -= count
+        n_remaining = n_rest
+
+    return combi
+
+
+def _allocate(sizes, n_samples):
+    '''Allocate samples to strata in proportion to size, by largest
+    remainder, with at least one per non-empty stratum while n_samples
+    allows, and never more than the size of a stratum.'''
+    if n_samples >= sum(sizes):
+        return list(sizes)
+
+    # One for each non-empty stratum, largest first:
+    alloc = [0] * len(sizes)
+
+    for idx in sorted([idx for idx, size in enumerate(sizes) if size],
+                      key=lambda idx: -sizes[idx])[:n_samples]:
+        alloc[idx] = 1
+
+    remaining = n_samples - sum(alloc)
+    caps = [size - count for size, count in zip(sizes, alloc)]
+    shares = [remaining * cap / sum(caps) for cap in caps]
+
+    for idx, share in enumerate(shares):
+        alloc[idx] += min(int(share), caps[idx])
+
+    for idx in sorted([idx for idx, size in enumerate(sizes)
+                       if alloc[idx] < size],
+                      key=lambda idx: int(shares[idx]) - shares[idx])[
+                          :n_samples - sum(alloc)]:
+        alloc[idx] += 1
+
+    return alloc
+
+
+def _get_shard(args):
+    '''Get shard from packed args.'''
+    return get_shard(*args)
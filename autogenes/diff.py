@@ -0,0 +1,235 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+from collections import OrderedDict
+import os
+import sys
+
+from autogenes import output
+import numpy as np
+import pandas as pd
+
+
+# Columns on which entries are matched, in turn, before being counted as
+# added or removed:
+_WORKLIST_TIERS = [
+    ('unchanged', ['ComponentName', 'SourcePlateBarcode', 'SourcePlateWell',
+                   'DestinationPlateBarcode', 'DestinationPlateWell',
+                   'Volume']),
+    ('volume_changed', ['ComponentName', 'SourcePlateBarcode',
+                        'SourcePlateWell', 'DestinationPlateBarcode',
+                        'DestinationPlateWell']),
+    ('moved', ['ComponentName', 'dest_name', 'Volume'])]
+
+_SUMMARY_TIERS = [
+    ('unchanged', ['src_plate', 'src_well', 'src_name', 'total_volume',
+                   'dest_plate']),
+    ('volume_changed', ['src_plate', 'src_well', 'src_name', 'dest_plate']),
+    ('moved', ['src_name', 'total_volume', 'dest_plate'])]
+
+_PLATE_TIERS = [
+    ('unchanged', ['plate', 'well', 'id']),
+    ('moved', ['id'])]
+
+_COUNTS = ['unchanged', 'volume_changed', 'moved', 'removed', 'added']
+
+
+def diff_runs(run_dir_a, run_dir_b, decimals=6):
+    '''Compare two runs, reporting the number of unchanged, volume changed,
+    moved, removed and added transfers, input summary entries and plate
+    contents of each stage.
+
+    Files with identical checksums are not compared further.'''
+    checksums_a = _get_checksums(run_dir_a)
+    checksums_b = _get_checksums(run_dir_b)
+    report = []
+
+    for stage in _get_stages(run_dir_a) | _get_stages(run_dir_b):
+        for name, filename, tiers, reader in [
+                ('worklist', 'worklist.csv', _WORKLIST_TIERS,
+                 _read_worklist),
+                ('input_summary', 'input_summary.csv', _SUMMARY_TIERS,
+                 _read_summary)]:
+            path = os.path.join(stage, filename)
+            checksum = _get_checksum(run_dir_a, path, checksums_a)
+
+            if checksum and \
+                    checksum == _get_checksum(run_dir_b, path, checksums_b):
+                counts = OrderedDict([('unchanged',
+                                       _count_rows(run_dir_a, path))])
+            else:
+                counts = diff(reader(run_dir_a, path, decimals),
+                              reader(run_dir_b, path, decimals), tiers)
+
+            report.append(_get_row(stage, name, counts))
+
+        counts = diff(_read_plates(run_dir_a, stage),
+                      _read_plates(run_dir_b, stage), _PLATE_TIERS)
+        report.append(_get_row(stage, 'plates', counts))
+
+    report = pd.DataFrame(report, columns=['stage', 'file'] + _COUNTS)
+    report['stage'] = pd.Categorical(report['stage'],
+                                     sorted(report['stage'].unique(),
+                                            key=_get_stage_key))
+    return report.sort_values(['stage'], kind='mergesort') \
+        .reset_index(drop=True)
+
+
+def diff(df_a, df_b, tiers):
+    '''Count entries of df_a and df_b matched one-to-one on the columns of
+    each tier in turn, and those left unmatched (removed from df_a and added
+    to df_b).'''
+    counts = OrderedDict()
+
+    for name, columns in tiers:
+        matched_a, matched_b = _match(df_a, df_b, columns)
+        counts[name] = int(matched_a.sum())
+        df_a, df_b = df_a[~matched_a], df_b[~matched_b]
+
+    counts['removed'] = len(df_a)
+    counts['added'] = len(df_b)
+    return counts
+
+
+def _match(df_a, df_b, columns):
+    '''Get masks of rows matched one-to-one on columns.'''
+    keys_a = _get_keys(df_a, columns)
+    keys_b = _get_keys(df_b, columns)
+    return np.isin(keys_a, keys_b), np.isin(keys_b, keys_a)
+
+
+def _get_keys(df, columns):
+    '''Get hash of each row's columns and occurrence, such that repeated rows
+    match one-to-one.'''
+    if df.empty:
+        return np.zeros(0, dtype=np.uint64)
+
+    hashes = pd.util.hash_pandas_object(df[columns], index=False).values
+    occurrences = pd.Series(hashes).groupby(hashes).cumcount().values
+
+    return pd.util.hash_pandas_object(
+        pd.DataFrame({'hash': hashes, 'occurrence': occurrences}),
+        index=False).values
+
+
+def _read_worklist(run_dir, path, decimals):
+    '''Read worklist, or empty worklist if missing.'''
+    return _read_csv(run_dir, path, _WORKLIST_TIERS[0][1] + ['dest_name'],
+                     ['Volume'], decimals)
+
+
+def _read_summary(run_dir, path, decimals):
+    '''Read input summary, or empty input summary if missing.'''
+    return _read_csv(run_dir, path, _SUMMARY_TIERS[0][1], ['total_volume'],
+                     decimals)
+
+
+def _read_csv(run_dir, path, columns, vol_columns, decimals):
+    '''Read csv, rounding volumes.'''
+    filepath = os.path.join(run_dir, path)
+
+    if not os.path.exists(filepath):
+        return pd.DataFrame(columns=columns)
+
+    df = pd.read_csv(filepath, dtype={col: str for col in columns
+                                      if col not in vol_columns})
+
+    for col in vol_columns:
+        df[col] = df[col].astype(float).round(decimals)
+
+    return df[columns]
+
+
+def _read_plates(run_dir, stage):
+    '''Read contents of a stage's plate maps, as (plate, well, id).'''
+    plates_dir = os.path.join(run_dir, stage, 'plates')
+    dfs = [pd.DataFrame(columns=['plate', 'well', 'id'])]
+
+    if os.path.isdir(plates_dir):
+        for filename in sorted(os.listdir(plates_dir)):
+            if filename.endswith('.csv'):
+                df = pd.read_csv(os.path.join(plates_dir, filename),
+                                 header=[0, 1], index_col=0, dtype=str)
+                ids = df['id'].stack()
+
+                dfs.append(pd.DataFrame({
+                    'plate': filename[:-4],
+                    'well': [row + col
+                             for row, col in ids.index.values],
+                    'id': ids.values}))
+
+    return pd.concat(dfs, ignore_index=True)
+
+
+def _get_stages(run_dir):
+    '''Get stages of a run.'''
+    if not os.path.isdir(run_dir):
+        raise IOError('Run directory not found: ' + run_dir)
+
+    return {os.path.relpath(dirpath, run_dir)
+            for dirpath, dirnames, filenames in os.walk(run_dir)
+            if 'worklist.csv' in filenames or 'plates' in dirnames}
+
+
+def _get_stage_key(stage):
+    '''Get sort key of stage, ordering numbered stages numerically.'''
+    tokens = stage.split('_')
+    return [int(token) if token.isdigit() else float('inf')
+            for token in tokens], stage
+
+
+def _get_checksums(run_dir):
+    '''Get checksums from a run's manifest, if any.'''
+    manifest = os.path.join(run_dir, 'manifest.csv')
+
+    if not os.path.exists(manifest):
+        return {}
+
+    df = pd.read_csv(manifest, dtype=str)
+    return dict(zip(df['path'], df['sha256']))
+
+
+def _get_checksum(run_dir, path, checksums):
+    '''Get checksum of file, from manifest if listed, or None if missing.'''
+    if path in checksums:
+        return checksums[path]
+
+    filepath = os.path.join(run_dir, path)
+
+    return output.get_checksum(filepath) if os.path.exists(filepath) \
+        else None
+
+
+def _count_rows(run_dir, path):
+    '''Count rows of csv file, excluding header.'''
+    with open(os.path.join(run_dir, path), 'rb') as fle:
+        return sum(1 for _ in fle) - 1
+
+
+def _get_row(stage, name, counts):
+    '''Get report row.'''
+    return [stage, name] + [counts.get(count, 0) for count in _COUNTS]
+
+
+def main(args):
+    '''main method.
+
+    Returns the number of entries changed, for use as an exit status.'''
+    report = diff_runs(args[0], args[1])
+    pd.set_option('display.width', 200)
+    print(report.to_string(index=False))
+
+    n_changed = int(report[_COUNTS[1:]].values.sum())
+    print('%d change(s)' % n_changed)
+    return n_changed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main(sys.argv[1:]) else 0)
@@ -10,7 +10,8 @@ To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
 # pylint: disable=too-few-public-methods
 # pylint: disable=too-many-arguments
 from autogenes import get_primers
-from autogenes.graph_writer import GraphWriter
+from autogenes.graph_writer import GraphWriter, get_vol_violations
+from autogenes.volume import Volume
 
 
 class WtOligoDilutionWriter(GraphWriter):
@@ -20,11 +21,21 @@ class WtOligoDilutionWriter(GraphWriter):
                  output_name):
         self.__oligo_ids = oligo_ids
         self.__primers = get_primers(designs)
-        self.__primer_vol = primer_vol
-        self.__oligo_vol = oligo_vol
-        self.__total_vol = total_vol
+        self.__primer_vol = Volume.from_ul(primer_vol)
+        self.__oligo_vol = Volume.from_ul(oligo_vol)
+        self.__total_vol = Volume.from_ul(total_vol)
         GraphWriter.__init__(self, output_name)
 
+    def get_violations(self, min_vol):
+        vols = [self.__primer_vol, self.__oligo_vol]
+        subjects = [self.get_output_name()] * 2
+
+        return get_vol_violations('Oligo', [vol.to_ul() for vol in vols],
+                                  subjects, min_vol) + \
+            get_vol_violations('Water', [(self.__total_vol - vol).to_ul()
+                                         for vol in vols],
+                               subjects, min_vol)
+
     def _initialise(self):
         for oligo_id in self.__oligo_ids:
             oligo = self._add_vertex(oligo_id, {'is_reagent': False})
@@ -35,6 +46,6 @@ class WtOligoDilutionWriter(GraphWriter):
             vol = self.__primer_vol \
                 if oligo_id in self.__primers else self.__oligo_vol
 
-            self._add_edge(oligo, oligo_dil, {'Volume': vol})
+            self._add_edge(oligo, oligo_dil, {'Volume': vol.to_ul()})
             self._add_edge(water, oligo_dil,
-                           {'Volume': self.__total_vol - vol})
+                           {'Volume': (self.__total_vol - vol).to_ul()})
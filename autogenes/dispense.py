@@ -0,0 +1,127 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import os
+import sys
+
+from autogenes import output, volume, worklist
+import numpy as np
+import pandas as pd
+
+# Maximum volume, in microlitres, aspirated into one tip:
+MAX_TIP_VOL = 200.0
+
+
+def consolidate(df, max_vol=MAX_TIP_VOL, reagents_only=True):
+    '''Consolidate a formatted worklist into multi-dispenses.
+
+    Within each run of consecutive transfers of a component from the same
+    plate (the reagent plate, if reagents_only), transfers from the same
+    source well, and so by the same channel, share one aspirate of their
+    total volume, up to max_vol, which is then dispensed to each
+    destination in turn. Transfers keep their order, and any larger than
+    max_vol are split into consecutive transfers of equal volume, up to
+    max_vol. Returns the worklist with the Aspirate (numbered from 1) and
+    AspirateVolume of each transfer.'''
+    max_nl = volume.to_nl(max_vol)
+
+    if max_nl < 1:
+        raise ValueError('Maximum tip volume must be positive: %s' % max_vol)
+
+    if df.empty:
+        return df.assign(Aspirate=pd.Series(dtype=int),
+                         AspirateVolume=pd.Series(dtype=float))
+
+    nls = volume.to_nl(df['Volume'].values)
+    n_parts = np.maximum(1, -(-nls // max_nl))
+
+    if (n_parts > 1).any():
+        df = df.loc[df.index.repeat(n_parts)].reset_index(drop=True)
+        nls = _split(nls, n_parts)
+        df['Volume'] = volume.to_ul(nls) if (nls % volume.NL_PER_UL).any() \
+            else nls // volume.NL_PER_UL
+
+    srcs = df[['ComponentName', 'SourcePlateBarcode']].values
+
+    # Runs of transfers that may share aspirates:
+    same = np.zeros(len(df), dtype=bool)
+    same[1:] = (srcs[1:] == srcs[:-1]).all(axis=1)
+
+    if reagents_only:
+        same &= df['SourcePlateBarcode'].values == worklist.REAGENT_PLATE
+
+    aspirates = np.empty(len(df), dtype=np.int64)
+    n_aspirates = 0
+
+    # (Aspirate, total volume) of each source well in the current run:
+    current = {}
+
+    for idx, (nl, is_same, src_well) in enumerate(
+            zip(nls, same, df['SourcePlateWell'].values)):
+        if not is_same:
+            current.clear()
+
+        aspirate, total = current.get(src_well, (None, 0))
+
+        if aspirate is None or total + nl > max_nl:
+            n_aspirates += 1
+            aspirate, total = n_aspirates, 0
+
+        current[src_well] = (aspirate, total + nl)
+        aspirates[idx] = aspirate
+
+    totals = pd.Series(nls).groupby(aspirates).transform('sum').values
+
+    return df.assign(Aspirate=aspirates,
+                     AspirateVolume=volume.to_ul(totals))
+
+
+def _split(nls, n_parts):
+    '''Split each volume, in nanolitres, into n_parts volumes, differing by
+    at most 1 nl.'''
+    starts = np.repeat(np.cumsum(n_parts) - n_parts, n_parts)
+    parts = np.repeat(nls // n_parts, n_parts)
+    return parts + (np.arange(len(parts)) - starts <
+                    np.repeat(nls % n_parts, n_parts))
+
+
+def consolidate_dir(run_dir_name, max_vol=MAX_TIP_VOL, reagents_only=True):
+    '''Write multi_dispense.csv, consolidating worklist.csv, for each stage
+    in a run directory, reporting aspirates before and after.'''
+    report = []
+
+    for dirpath, _, filenames in sorted(os.walk(run_dir_name)):
+        if 'worklist.csv' in filenames:
+            df = pd.read_csv(os.path.join(dirpath, 'worklist.csv'))
+            consolidated_df = consolidate(df, max_vol, reagents_only)
+            consolidated_df.to_csv(os.path.join(dirpath,
+                                                'multi_dispense.csv'),
+                                   index=False)
+
+            report.append([os.path.relpath(dirpath, run_dir_name),
+                           len(df),
+                           consolidated_df['Aspirate'].nunique()])
+
+    return pd.DataFrame(report, columns=['stage', 'aspirates_before',
+                                         'aspirates_after'])
+
+
+def main(args):
+    '''main method.'''
+    report = consolidate_dir(args[0], *[float(arg) for arg in args[1:]])
+
+    if os.path.exists(os.path.join(args[0], 'manifest.csv')):
+        output.write_manifest(args[0])
+
+    print(report.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -13,7 +13,8 @@ from collections import defaultdict
 import itertools
 
 from autogenes import get_dil_oligo_id, get_block_id, get_design_id, \
-    get_pos_muts
+    get_pool_id, get_pool_pos_muts
+from autogenes.block import get_pools
 from autogenes.pcr import PcrWriter
 
 
@@ -27,7 +28,7 @@ class GenePcrWriter(PcrWriter):
         PcrWriter.__init__(self, comps_vol, wt_primer_vol, mut_primer_vol,
                            total_vol, output_name)
 
-    def _initialise(self):
+    def _get_reactions(self):
         for design in self.__designs:
             pcr_comps_ids = [get_block_id(block_idx, block) + '_b'
                              for block_idx, block in enumerate(design)]
@@ -35,42 +36,47 @@ class GenePcrWriter(PcrWriter):
             primer_ids = [get_dil_oligo_id(design[0][0])[0],
                           get_dil_oligo_id(design[-1][-1])[0]]
 
-            self._add_pcr(get_design_id(design), pcr_comps_ids, primer_ids)
+            yield get_design_id(design), pcr_comps_ids, primer_ids
 
 
 class CombiGenePcrWriter(PcrWriter):
-    '''Class for generating combinatorial gene PCR worklist graphs.'''
+    '''Class for generating combinatorial gene PCR worklist graphs.
+
+    If pools, the block PCRs of each pool of a run being extended, are
+    given, only reactions using a new pool are generated.'''
 
     def __init__(self, designs, max_muts, comps_vol, wt_primer_vol,
-                 mut_primer_vol, total_vol, primer_ids, output_name):
+                 mut_primer_vol, total_vol, primer_ids, output_name,
+                 pools=None):
         self.__designs = designs
         self.__primer_ids = primer_ids
         self.__max_muts = max_muts
+        self.__pools = pools if pools else {}
         PcrWriter.__init__(self, comps_vol, wt_primer_vol, mut_primer_vol,
                            total_vol, output_name)
 
-    def _initialise(self):
-        pos_muts = defaultdict(set)
+    def _get_reactions(self):
+        pos_pools = defaultdict(set)
+        new_pool_ids = set(get_pools(self.__designs, self.__pools).values())
 
-        for design in self.__designs:
-            for block_idx, block in enumerate(design):
-                block_id = get_block_id(block_idx, block)
-                pos, muts = get_pos_muts(block_id)
-                pos_muts[pos].add(muts)
+        for pool_id in new_pool_ids.union(self.__pools):
+            pos, muts, generation = get_pool_pos_muts(pool_id)
+            pos_pools[pos].add((muts, generation))
 
-        combis = [list(muts) for pos, muts in pos_muts.items()]
+        positions = sorted(pos_pools)
+        combis = [sorted(pos_pools[pos]) for pos in positions]
         combis = [combi for combi in itertools.product(*combis)
-                  if sum(combi) <= self.__max_muts]
+                  if sum(muts for muts, _ in combi) <= self.__max_muts]
 
         for combi in combis:
-            pcr_comps_ids = []
-
-            for pos, muts in enumerate(combi):
-                pool_id = str(pos + 1) + '_' + \
-                    (str(muts) if muts > 0 else 'wt') + '_p'
+            pcr_comps_ids = [get_pool_id(pos, muts, generation)
+                             for pos, (muts, generation)
+                             in zip(positions, combi)]
 
-                pcr_comps_ids.append(pool_id)
+            if self.__pools and new_pool_ids.isdisjoint(pcr_comps_ids):
+                # Reaction made in the run being extended:
+                continue
 
-            self._add_pcr('-'.join([pcr_comps_id[:-2]
-                                    for pcr_comps_id in pcr_comps_ids]),
-                          pcr_comps_ids, self.__primer_ids)
+            yield '-'.join([pcr_comps_id[:-2]
+                            for pcr_comps_id in pcr_comps_ids]), \
+                pcr_comps_ids, self.__primer_ids
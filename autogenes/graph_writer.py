@@ -8,7 +8,13 @@ To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
 @author: neilswainston
 '''
 # pylint: disable=invalid-name
+# pylint: disable=unused-argument
+from collections import namedtuple
+
 from synbiochem.utils.graph_utils import add_edge, add_vertex, Graph
+import numpy as np
+
+Violation = namedtuple('Violation', ['check', 'subject', 'value', 'message'])
 
 
 class GraphWriter():
@@ -27,10 +33,21 @@ class GraphWriter():
 
         return self.__graph
 
+    def write(self, graph):
+        '''Writes into a given (e.g. shared) graph.'''
+        self.__graph = graph
+        self.__initialised = False
+        return self.get_graph()
+
     def get_output_name(self):
         '''Gets output name.'''
         return self.__output_name
 
+    def get_violations(self, min_vol):
+        '''Gets Violations of writer parameters, checked without building
+        the graph.'''
+        return []
+
     def _initialise(self):
         '''Initialise graph.'''
 
@@ -41,3 +58,22 @@ class GraphWriter():
     def _add_edge(self, vertex_from, vertex_to, kwds):
         '''Add edge to graph.'''
         return add_edge(self.__graph, vertex_from, vertex_to, kwds)
+
+
+def get_vol_violations(name, vols, subjects, min_vol):
+    '''Get Violations for negative volumes, or those below min_vol.'''
+    vols = np.asarray(vols, dtype=float)
+    violations = []
+
+    for idx in np.flatnonzero(vols < 0):
+        violations.append(Violation('negative_volume', subjects[idx],
+                                    vols[idx],
+                                    '%s volume is negative' % name))
+
+    for idx in np.flatnonzero((vols >= 0) & (vols < min_vol)):
+        violations.append(Violation('below_min_volume', subjects[idx],
+                                    vols[idx],
+                                    '%s volume is below %s' %
+                                    (name, min_vol)))
+
+    return violations
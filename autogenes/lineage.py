@@ -0,0 +1,307 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import sys
+
+from autogenes import get_block_id, get_design_id, worklist
+import numpy as np
+import pandas as pd
+
+
+class LineageIndex():
+    '''Class to represent the lineage of designs: every transfer, between
+    components and wells, the component graph as compressed sparse row
+    (CSR) arrays, and the block PCRs and products of each design.'''
+
+    def __init__(self, arrays):
+        self.__arrays = arrays
+        self.__names = {name: idx
+                        for idx, name in enumerate(arrays['names'])}
+        self.__designs = {name: idx
+                          for idx, name in enumerate(arrays['designs'])}
+        self.__derived = None
+
+    def get_inputs(self, design_id):
+        '''Get transfers in the lineage of a design: every transfer into its
+        block PCRs, directly or indirectly, and those into components linking
+        its block PCRs to its products, other than from other designs' block
+        PCRs.'''
+        if design_id not in self.__designs:
+            raise KeyError('Unknown design: ' + design_id)
+
+        arrays = self.__arrays
+        idx = self.__designs[design_id]
+        blocks = _get_row(arrays['block_ptr'], arrays['block_idx'], idx)
+        products = _get_row(arrays['product_ptr'], arrays['product_idx'],
+                            idx)
+
+        upstream = self.__traverse('parent', blocks)
+        path = self.__traverse('child', blocks) & \
+            self.__traverse('parent', products)
+        srcs, dests = arrays['src'], arrays['dest']
+
+        return self.__get_transfers(
+            upstream[dests] |
+            (path[dests] & (upstream[srcs] | path[srcs] |
+                            ~self.__get_derived()[srcs])))
+
+    def get_affected(self, plate, well):
+        '''Get designs whose lineage includes a well, e.g. one that failed,
+        from the components transferred from or into it.'''
+        arrays = self.__arrays
+        locs = np.flatnonzero(
+            (arrays['plates'][arrays['loc_plate']] == plate) &
+            (arrays['wells'][arrays['loc_well']] == well))
+        in_well = np.isin(arrays['src_loc'], locs) | \
+            np.isin(arrays['dest_loc'], locs)
+        comps = np.unique(arrays['dest'][in_well])
+
+        downstream = self.__traverse('child', comps)
+        upstream = self.__traverse('parent', comps)
+
+        # Designs with block PCRs downstream, or upstream with a product
+        # downstream:
+        affected = _any(downstream, arrays['block_ptr'], arrays['block_idx'])
+        affected |= _any(upstream, arrays['block_ptr'],
+                         arrays['block_idx']) & \
+            _any(downstream, arrays['product_ptr'], arrays['product_idx'])
+
+        return list(arrays['designs'][affected])
+
+    def get_designs(self):
+        '''Get design ids.'''
+        return [str(design_id) for design_id in self.__arrays['designs']]
+
+    def get_parents(self, name):
+        '''Get names of components transferred directly into a component.'''
+        if name not in self.__names:
+            raise KeyError('Unknown component: ' + name)
+
+        return [str(parent)
+                for parent in self.__arrays['names'][
+                    _get_row(self.__arrays['parent_ptr'],
+                             self.__arrays['parent_idx'],
+                             self.__names[name])]]
+
+    def get_ancestors(self, name):
+        '''Get names of components transferred, directly or indirectly, into
+        a component.'''
+        return self.__get_related('parent', name)
+
+    def get_descendants(self, name):
+        '''Get names of components made, directly or indirectly, from a
+        component.'''
+        return self.__get_related('child', name)
+
+    def save(self, filename):
+        '''Save index in compressed binary (npz) form.'''
+        np.savez_compressed(filename, **self.__arrays)
+
+    def __get_related(self, direction, name):
+        '''Get names of related components.'''
+        if name not in self.__names:
+            raise KeyError('Unknown component: ' + name)
+
+        related = self.__traverse(direction, [self.__names[name]])
+        related[self.__names[name]] = False
+        return list(self.__arrays['names'][related])
+
+    def __get_derived(self):
+        '''Get mask of components made from any block PCR.'''
+        if self.__derived is None:
+            self.__derived = self.__traverse('child',
+                                             self.__arrays['block_idx'])
+
+        return self.__derived
+
+    def __traverse(self, direction, starts):
+        '''Get mask of components reachable from starts (inclusive), via
+        parents or children.'''
+        return _traverse(self.__arrays[direction + '_ptr'],
+                         self.__arrays[direction + '_idx'],
+                         np.asarray(starts, dtype=np.int64))
+
+    def __get_transfers(self, mask):
+        '''Get transfers, as (stage, source and destination name, plate and
+        well).'''
+        arrays = self.__arrays
+        df = pd.DataFrame({'stage': arrays['stages'][arrays['stage'][mask]]})
+
+        for prefix in ['src', 'dest']:
+            locs = arrays[prefix + '_loc'][mask]
+            df[prefix + '_name'] = arrays['names'][arrays[prefix][mask]]
+            df[prefix + '_plate'] = arrays['plates'][arrays['loc_plate'][locs]]
+            df[prefix + '_well'] = arrays['wells'][arrays['loc_well'][locs]]
+
+        return df
+
+
+def build(stages, designs):
+    '''Build LineageIndex from the Stages of a pipeline run and its
+    designs.'''
+    df = pd.concat([worklist.format_stage(stage.worklists)
+                    .assign(stage=stage.name)
+                    for stage in stages] +
+                   [worklist.format_stage([]).assign(stage='')],
+                   ignore_index=True)
+
+    names, codes = _factorize(pd.concat([df['ComponentName'],
+                                         df['dest_name']]))
+    src, dest = np.split(codes, 2)
+
+    # Unique wells, as (plate, well):
+    plate_codes, plates = pd.factorize(
+        pd.concat([df['SourcePlateBarcode'],
+                   df['DestinationPlateBarcode']]).astype(str),
+        sort=True)
+    well_codes, wells = pd.factorize(
+        pd.concat([df['SourcePlateWell'],
+                   df['DestinationPlateWell']]).astype(str),
+        sort=True)
+    locs, loc_codes = np.unique(np.stack([plate_codes, well_codes], axis=1),
+                                axis=0, return_inverse=True)
+    src_loc, dest_loc = np.split(loc_codes.reshape(-1), 2)
+    stages, stage_codes = _factorize(df['stage'])
+
+    arrays = {'names': names,
+              'plates': np.array(plates, dtype=str),
+              'wells': np.array(wells, dtype=str),
+              'stages': stages,
+              'loc_plate': locs[:, 0].astype(np.int32),
+              'loc_well': locs[:, 1].astype(np.int32),
+              'src': src.astype(np.int32),
+              'dest': dest.astype(np.int32),
+              'src_loc': src_loc.astype(np.int32),
+              'dest_loc': dest_loc.astype(np.int32),
+              'stage': stage_codes.astype(np.int16)}
+
+    # Component graph, from unique transfers:
+    edges = np.unique(np.stack([src, dest], axis=1), axis=0)
+
+    for direction, (frm, to) in [('parent', (1, 0)), ('child', (0, 1))]:
+        order = np.argsort(edges[:, frm], kind='mergesort')
+        arrays[direction + '_ptr'] = _get_ptr(edges[order, frm], len(names))
+        arrays[direction + '_idx'] = edges[order, to].astype(np.int32)
+
+    names_idx = {name: idx for idx, name in enumerate(names)}
+    arrays.update(_get_design_arrays(designs, names_idx, arrays))
+    return LineageIndex(arrays)
+
+
+def load(filename):
+    '''Load LineageIndex.'''
+    with np.load(filename) as data:
+        return LineageIndex({key: data[key] for key in data.files})
+
+
+def _get_design_arrays(designs, name_idx, arrays):
+    '''Get design ids, and the block PCRs and products of each as CSR
+    arrays.
+
+    The products of a design are those components made from all of its
+    block PCRs from which nothing further is made.'''
+    design_ids = []
+    blocks = []
+    products = []
+    descendants = {}
+    is_leaf = np.diff(arrays['child_ptr']) == 0
+
+    for design in designs:
+        design_ids.append(get_design_id(design))
+        block_idxs = [name_idx[block_name]
+                      for block_name in [get_block_id(block_idx, block) + '_b'
+                                         for block_idx, block
+                                         in enumerate(design)]
+                      if block_name in name_idx]
+        blocks.append(block_idxs)
+
+        common = None
+
+        for block_idx in block_idxs:
+            if block_idx not in descendants:
+                descendants[block_idx] = _traverse(
+                    arrays['child_ptr'], arrays['child_idx'],
+                    np.array([block_idx])) & is_leaf
+
+            common = descendants[block_idx] if common is None \
+                else common & descendants[block_idx]
+
+        products.append(np.flatnonzero(common)
+                        if common is not None else [])
+
+    return {'designs': np.array(design_ids, dtype=str),
+            'block_ptr': np.cumsum([0] + [len(row) for row in blocks]),
+            'block_idx': np.array([idx for row in blocks for idx in row],
+                                  dtype=np.int32),
+            'product_ptr': np.cumsum([0] + [len(row) for row in products]),
+            'product_idx': np.array([idx for row in products for idx in row],
+                                    dtype=np.int32)}
+
+
+def _factorize(values):
+    '''Get sorted unique values, as a string array, and codes.'''
+    codes, uniques = pd.factorize(pd.Series(values, dtype=str), sort=True)
+    return np.array(uniques, dtype=str), codes.astype(np.int64)
+
+
+def _get_ptr(rows, n_rows):
+    '''Get CSR row pointers from sorted row indices.'''
+    return np.concatenate([[0], np.cumsum(np.bincount(rows,
+                                                      minlength=n_rows))])
+
+
+def _get_row(ptr, idx, row):
+    '''Get values of a CSR row.'''
+    return idx[ptr[row]:ptr[row + 1]]
+
+
+def _get_offsets(starts, lens):
+    '''Get offsets of the values of several CSR rows.'''
+    return np.repeat(starts - np.cumsum(lens) + lens, lens) + \
+        np.arange(lens.sum())
+
+
+def _traverse(ptr, idx, starts):
+    '''Get mask of rows reachable from starts (inclusive), breadth first.'''
+    reached = np.zeros(len(ptr) - 1, dtype=bool)
+    reached[starts] = True
+    frontier = np.unique(starts)
+
+    while frontier.size:
+        nbrs = idx[_get_offsets(ptr[frontier],
+                                ptr[frontier + 1] - ptr[frontier])]
+        frontier = np.unique(nbrs[~reached[nbrs]])
+        reached[frontier] = True
+
+    return reached
+
+
+def _any(mask, ptr, idx):
+    '''Get whether any value of each CSR row is in mask.'''
+    counts = np.concatenate([[0], np.cumsum(mask[idx])])
+    return counts[ptr[1:]] > counts[ptr[:-1]]
+
+
+def main(args):
+    '''main method.'''
+    index = load(args[0])
+    pd.set_option('display.width', 200)
+
+    if args[1] == 'design':
+        print(index.get_inputs(args[2]).to_string(index=False))
+    elif args[1] == 'well':
+        print('\n'.join(index.get_affected(args[2], args[3])))
+    else:
+        raise ValueError('Unknown query %s: choose from design or well' %
+                         args[1])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,30 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+from autogenes import adaptive_opt, serpentine_opt, smart_sort_opt
+
+# Optimiser modules, by name. Each has an optimise(df) function, called on
+# each group of transfers (see worklist.optimise) with a DataFrame of only
+# their location columns (worklist._LOCATION_COLUMNS), as integers, with
+# plates and wells coded in sort order, and a _row column. It returns the
+# same rows, including _row, in optimised order. Other worklist columns,
+# e.g. names and volumes, are not passed, such that groups can be shared
+# with worker processes cheaply:
+OPTIMISERS = {'smart_sort': smart_sort_opt,
+              'serpentine': serpentine_opt,
+              'adaptive': adaptive_opt}
+
+
+def get_optimiser(name):
+    '''Get optimiser module by name.'''
+    try:
+        return OPTIMISERS[name]
+    except KeyError:
+        raise ValueError('Unknown optimiser %s: choose from %s' %
+                         (name, ', '.join(sorted(OPTIMISERS))))
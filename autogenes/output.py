@@ -0,0 +1,250 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=import-outside-toplevel
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+import pandas as pd
+
+
+POLICIES = ['replace', 'suffix', 'lock']
+
+
+class OutputWriter():
+    '''Class to write output files in the background.
+
+    At most max_pending writes are queued at once; submit blocks until a slot
+    is free, bounding the memory held by unwritten output.'''
+
+    def __init__(self, max_workers=4, max_pending=64):
+        self.__executor = ThreadPoolExecutor(max_workers) \
+            if max_workers else None
+        self.__slots = threading.BoundedSemaphore(max_pending)
+        self.__futures = []
+
+    def write_plate(self, plt, out_dir_name):
+        '''Write plate, snapshotting it as later stages may modify it.'''
+        self.submit(plt.copy().to_csv, out_dir_name)
+
+    def submit(self, func, *args, **kwargs):
+        '''Submit a write.'''
+        if not self.__executor:
+            func(*args, **kwargs)
+            return
+
+        self.__slots.acquire()
+
+        try:
+            future = self.__executor.submit(func, *args, **kwargs)
+        except BaseException:
+            self.__slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self.__slots.release())
+        self.__futures.append(future)
+
+    def flush(self):
+        '''Wait for all submitted writes, raising the first error.'''
+        futures, self.__futures = self.__futures, []
+        errors = [future.exception() for future in futures
+                  if future.exception()]
+
+        if errors:
+            raise IOError('%d output write(s) failed' % len(errors)) \
+                from errors[0]
+
+    def close(self):
+        '''Flush and release worker threads.'''
+        try:
+            self.flush()
+        finally:
+            if self.__executor:
+                self.__executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            # Don't mask the original error:
+            if self.__executor:
+                self.__executor.shutdown()
+        else:
+            self.close()
+
+
+class StagedOutput():
+    '''Class to stage output in a temporary sibling directory, published
+    atomically by renaming it into place once complete.
+
+    Published output includes manifest.csv, listing the size and SHA-256
+    checksum of every file. If the output directory exists, policy is
+    replace (replace it), suffix (publish to the first free name_2, name_3,
+    etc.) or lock (replace it, holding a lock for the whole run, so that
+    runs to the same directory are serialised).'''
+
+    def __init__(self, out_dir_name, policy='replace'):
+        if policy not in POLICIES:
+            raise ValueError('Unknown policy %s: choose from %s'
+                             % (policy, ', '.join(POLICIES)))
+
+        self.__out_dir = os.path.abspath(out_dir_name)
+        self.__policy = policy
+        self.__tmp_dir = None
+        self.__lock = None
+        self.__path = None
+
+    def get_path(self):
+        '''Get directory output was published to.'''
+        return self.__path
+
+    def __enter__(self):
+        parent_dir, name = os.path.split(self.__out_dir)
+        os.makedirs(parent_dir, exist_ok=True)
+
+        if self.__policy == 'lock':
+            self.__lock = open(os.path.join(parent_dir, '.' + name + '.lock'),
+                               'w')
+            _lock(self.__lock)
+
+        self.__tmp_dir = tempfile.mkdtemp(prefix='.' + name + '.tmp-',
+                                          dir=parent_dir)
+        os.chmod(self.__tmp_dir, 0o755)
+        return self.__tmp_dir
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type:
+                shutil.rmtree(self.__tmp_dir, ignore_errors=True)
+            else:
+                write_manifest(self.__tmp_dir)
+                self.__path = self.__publish()
+        finally:
+            if self.__lock:
+                self.__lock.close()
+
+    def __publish(self):
+        '''Rename staged output into place.'''
+        parent_dir, name = os.path.split(self.__out_dir)
+
+        if self.__policy == 'suffix':
+            idx = 1
+
+            while True:
+                path = self.__out_dir if idx == 1 \
+                    else self.__out_dir + '_' + str(idx)
+
+                try:
+                    # Fails if path exists and is not empty:
+                    os.rename(self.__tmp_dir, path)
+                    break
+                except OSError:
+                    if not os.path.exists(path):
+                        raise
+
+                    idx += 1
+        else:
+            path = self.__out_dir
+            old_dir = None
+
+            if os.path.exists(path):
+                old_dir = tempfile.mkdtemp(prefix='.' + name + '.old-',
+                                           dir=parent_dir)
+                os.rename(path, os.path.join(old_dir, name))
+
+            os.rename(self.__tmp_dir, path)
+
+            if old_dir:
+                shutil.rmtree(old_dir)
+
+        _fsync(parent_dir)
+        return path
+
+
+def write_manifest(dir_name, filename='manifest.csv'):
+    '''Write manifest of the size and SHA-256 checksum of every file,
+    syncing each file, and directory, to disk.'''
+    files = []
+
+    manifest = os.path.join(dir_name, filename)
+
+    for dirpath, _, filenames in os.walk(dir_name):
+        for fname in sorted(filenames):
+            filepath = os.path.join(dirpath, fname)
+
+            if filepath == manifest:
+                continue
+
+            files.append([os.path.relpath(filepath, dir_name),
+                          os.path.getsize(filepath),
+                          get_checksum(filepath, sync=True)])
+
+        _fsync(dirpath)
+
+    pd.DataFrame(sorted(files),
+                 columns=['path', 'size', 'sha256']).to_csv(manifest,
+                                                            index=False)
+
+    with open(manifest, 'rb') as fle:
+        os.fsync(fle.fileno())
+
+    _fsync(dir_name)
+
+
+def get_checksum(filepath, sync=False):
+    '''Get SHA-256 checksum of file, optionally syncing it to disk.'''
+    sha = hashlib.sha256()
+
+    with open(filepath, 'rb') as fle:
+        for chunk in iter(lambda: fle.read(1 << 20), b''):
+            sha.update(chunk)
+
+        if sync:
+            os.fsync(fle.fileno())
+
+    return sha.hexdigest()
+
+
+def _lock(fle):
+    '''Lock an open file exclusively, waiting while another process holds
+    it.'''
+    try:
+        import fcntl
+    except ImportError:
+        # Windows:
+        import msvcrt
+
+        while True:
+            try:
+                # Retries for 10 seconds before raising:
+                msvcrt.locking(fle.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                pass
+
+    fcntl.flock(fle, fcntl.LOCK_EX)
+
+
+def _fsync(dir_name):
+    '''Sync directory entries to disk.'''
+    if os.name == 'nt':
+        # Directories cannot be opened, and entries are synced, on Windows:
+        return
+
+    fd = os.open(dir_name, os.O_RDONLY)
+
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
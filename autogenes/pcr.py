@@ -10,7 +10,9 @@ To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
 # pylint: disable=invalid-name
 # pylint: disable=too-few-public-methods
 # pylint: disable=too-many-arguments
-from autogenes.graph_writer import GraphWriter
+from autogenes.graph_writer import GraphWriter, get_vol_violations
+from autogenes.volume import Volume, to_ul
+import numpy as np
 
 
 class PcrWriter(GraphWriter):
@@ -18,12 +20,47 @@ class PcrWriter(GraphWriter):
 
     def __init__(self, comps_vol, wt_primer_vol, mut_primer_vol, total_vol,
                  output_name):
-        self._comps_vol = comps_vol
-        self.__wt_primer_vol = wt_primer_vol
-        self.__mut_primer_vol = mut_primer_vol
-        self.__total_vol = total_vol
+        self._comps_vol = Volume.from_ul(comps_vol)
+        self.__wt_primer_vol = Volume.from_ul(wt_primer_vol)
+        self.__mut_primer_vol = Volume.from_ul(mut_primer_vol)
+        self.__total_vol = Volume.from_ul(total_vol)
         GraphWriter.__init__(self, output_name)
 
+    def get_violations(self, min_vol):
+        reactions = list(self._get_reactions())
+        pcr_ids = [reaction[0] for reaction in reactions]
+
+        n_comps = np.array([len(reaction[1]) for reaction in reactions])
+        n_mut_primers = np.array([sum(1 for primer_id in reaction[2]
+                                      if primer_id[1])
+                                  for reaction in reactions])
+        n_wt_primers = np.array([len(reaction[2])
+                                 for reaction in reactions]) - n_mut_primers
+
+        mm_vols = self.__total_vol - self._comps_vol * n_comps - \
+            self.__mut_primer_vol * n_mut_primers - \
+            self.__wt_primer_vol * n_wt_primers
+
+        violations = get_vol_violations('Master mix', to_ul(mm_vols),
+                                        pcr_ids, min_vol)
+
+        for name, vol in [('Component', self._comps_vol),
+                          ('Wild-type primer', self.__wt_primer_vol),
+                          ('Mutant primer', self.__mut_primer_vol)]:
+            violations.extend(get_vol_violations(name, [vol.to_ul()],
+                                                 [self.get_output_name()],
+                                                 min_vol))
+
+        return violations
+
+    def _initialise(self):
+        for pcr_id, pcr_comps_ids, primer_ids in self._get_reactions():
+            self._add_pcr(pcr_id, pcr_comps_ids, primer_ids)
+
+    def _get_reactions(self):
+        '''Get (pcr_id, pcr_comps_ids, primer_ids) of each reaction.'''
+        return iter([])
+
     def _add_pcr(self, pcr_id, pcr_comps_ids, primer_ids):
         '''Add PCR reaction to worklist graph.'''
         mm_vol = self.__total_vol
@@ -33,7 +70,8 @@ class PcrWriter(GraphWriter):
             pcr_comps = self._add_vertex(pcr_comps_id,
                                          {'is_reagent': False})
 
-            self._add_edge(pcr_comps, pcr, {'Volume': self._comps_vol})
+            self._add_edge(pcr_comps, pcr,
+                           {'Volume': self._comps_vol.to_ul()})
             mm_vol -= self._comps_vol
 
         # Add outer oligos:
@@ -44,9 +82,9 @@ class PcrWriter(GraphWriter):
             primer_vol = self.__mut_primer_vol if primer_id[1] \
                 else self.__wt_primer_vol
 
-            self._add_edge(primer, pcr, {'Volume': primer_vol})
+            self._add_edge(primer, pcr, {'Volume': primer_vol.to_ul()})
 
             mm_vol -= primer_vol
 
         mm = self._add_vertex('mm', {'is_reagent': True})
-        self._add_edge(mm, pcr, {'Volume': mm_vol})
+        self._add_edge(mm, pcr, {'Volume': mm_vol.to_ul()})
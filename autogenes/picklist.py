@@ -0,0 +1,132 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+from collections import defaultdict, OrderedDict
+import os
+import sys
+
+from autogenes import output, simulate
+import pandas as pd
+
+
+def batch(df, deck_plates=simulate.DEFAULT_MODEL.deck_plates):
+    '''Reorder a formatted worklist into (source plate, destination plate)
+    blocks, ordered to minimise plates loaded onto the deck.
+
+    Components made in the worklist are only used once all transfers into
+    them are complete. Within each block, transfers keep their order. The
+    original order is kept if it loads fewer plates.'''
+    if df.empty:
+        return df
+
+    blocks = defaultdict(list)
+    keys = list(zip(get_phases(df),
+                    df['SourcePlateBarcode'],
+                    df['DestinationPlateBarcode']))
+
+    for idx, key in enumerate(keys):
+        blocks[key].append(idx)
+
+    deck = OrderedDict()
+    order = []
+
+    for phase in sorted({key[0] for key in blocks}):
+        # Blocks in order of first transfer:
+        remaining = [key for key in blocks if key[0] == phase]
+
+        while remaining:
+            key = min(remaining,
+                      key=lambda key: (_get_loads(deck, key[1:]),
+                                       key[2] not in deck))
+            remaining.remove(key)
+            order.extend(blocks[key])
+            _load(deck, key[1:], deck_plates)
+
+    batched_df = df.iloc[order]
+
+    if simulate.get_swaps(batched_df, deck_plates) > \
+            simulate.get_swaps(df, deck_plates):
+        return df
+
+    return batched_df
+
+
+def batch_dir(run_dir_name, deck_plates=simulate.DEFAULT_MODEL.deck_plates):
+    '''Batch each stage's worklist.csv in a run directory, in place,
+    reporting plates loaded before and after.'''
+    report = []
+
+    for dirpath, _, filenames in sorted(os.walk(run_dir_name)):
+        if 'worklist.csv' in filenames:
+            filepath = os.path.join(dirpath, 'worklist.csv')
+            df = pd.read_csv(filepath)
+            batched_df = batch(df, deck_plates)
+            batched_df.to_csv(filepath, index=False)
+
+            report.append([os.path.relpath(dirpath, run_dir_name),
+                           simulate.get_swaps(df, deck_plates),
+                           simulate.get_swaps(batched_df, deck_plates)])
+
+    return pd.DataFrame(report, columns=['stage', 'swaps_before',
+                                         'swaps_after'])
+
+
+def get_phases(df):
+    '''Get phase of each transfer: 0 if its component is not made in the
+    worklist, otherwise one more than the phase of the component's
+    inputs.'''
+    inputs = defaultdict(set)
+
+    for src_name, dest_name in df[['ComponentName', 'dest_name']].values:
+        inputs[dest_name].add(src_name)
+
+    depths = {}
+
+    def _get_depth(name):
+        if name not in depths:
+            depths[name] = 0
+            depths[name] = 1 + max(_get_depth(src_name)
+                                   for src_name in inputs[name]) \
+                if name in inputs else 0
+
+        return depths[name]
+
+    return [_get_depth(name) for name in df['ComponentName']]
+
+
+def _get_loads(deck, plates):
+    '''Get number of plates not on deck.'''
+    return len({plt for plt in plates if plt not in deck})
+
+
+def _load(deck, plates, deck_plates):
+    '''Load plates, evicting least recently used, as simulate.'''
+    for plt in plates:
+        if plt in deck:
+            deck.move_to_end(plt)
+        else:
+            deck[plt] = True
+
+            if len(deck) > max(deck_plates, 2):
+                deck.popitem(last=False)
+
+
+def main(args):
+    '''main method.'''
+    report = batch_dir(args[0], *[int(arg) for arg in args[1:]])
+
+    if os.path.exists(os.path.join(args[0], 'manifest.csv')):
+        output.write_manifest(args[0])
+
+    print(report.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
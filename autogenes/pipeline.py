@@ -9,16 +9,24 @@ To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
 '''
 # pylint: disable=invalid-name
 # pylint: disable=wrong-import-order
+from collections import defaultdict, namedtuple
+from contextlib import nullcontext
 import os
-import shutil
 
-from autogenes import plate, worklist
+from autogenes import dag, plate, smart_sort_opt, store, validate, volume, \
+    worklist
+from autogenes.output import OutputWriter, StagedOutput
 import pandas as pd
 
 
+Stage = namedtuple('Stage', ['name', 'worklists', 'plates', 'summary'])
+
+
 def get_input_plates(dir_name):
-    '''Get input plates.'''
+    '''Get input plates, holding bulky properties, e.g. sequences, once in a
+    shared store.'''
     input_plates = {}
+    shared_store = store.Store()
 
     for(dirpath, _, filenames) in os.walk(dir_name):
         for filename in filenames:
@@ -27,7 +35,7 @@ def get_input_plates(dir_name):
                 _, name = os.path.split(filename)
 
                 if 'well' in df.columns.values:
-                    plt = plate.from_table(df, name)
+                    plt = plate.from_table(df, name, shared_store)
 
                 else:
                     plt = plate.from_plate(df, name)
@@ -37,58 +45,172 @@ def get_input_plates(dir_name):
     return input_plates
 
 
+def get_run_plates(run_dir_name):
+    '''Get plates, as last written, from a previous run's output.'''
+    plates = {}
+
+    for stage in sorted(os.listdir(run_dir_name),
+                        key=lambda stage: [int(val)
+                                           for val in stage.split('_')]
+                        if stage.replace('_', '').isdigit() else []):
+        plates_dir = os.path.join(run_dir_name, stage, 'plates')
+
+        if not os.path.isdir(plates_dir):
+            continue
+
+        for filename in sorted(os.listdir(plates_dir)):
+            if filename.endswith('.csv'):
+                df = pd.read_csv(os.path.join(plates_dir, filename),
+                                 header=[0, 1], index_col=0, dtype=str)
+                plt = plate.from_map(df, filename)
+                plates[plt.get_name()] = plt
+
+    return plates
+
+
 def run(wrtrs, input_plates=None, plate_names=None,
-        parent_out_dir_name='.'):
-    '''Run pipeline.'''
+        parent_out_dir_name='.', working_vol=None, io_workers=4,
+        optimiser=smart_sort_opt, existing=None, combined=False,
+        parallel_threshold=worklist.PARALLEL_THRESHOLD, staged=False):
+    '''Run pipeline.
+
+    If working_vol is given, components whose total demand exceeds it are
+    split across several source wells, and a ValueError, listing every
+    violation, is raised before any stage is run if a transfer is larger
+    than it, or an input well is drawn more than it (see
+    worklist.get_working_vol_violations).
+
+    Output files are written by io_workers background threads (or
+    synchronously if 0), overlapping with subsequent stages; all writes are
+    complete when run returns.
+
+    Transfers between components that are both in existing are skipped,
+    such that only the delta from an earlier run is generated. Transfers of
+    other components into those in existing, e.g. into pools already used,
+    raise a ValueError.
+
+    If combined, all writers write into a single graph, from which each
+    stage is taken as a view, with component locations shared between
+    stages.
+
+    Stages of at least parallel_threshold transfers are optimised in a
+    process pool (see worklist.optimise).
+
+    If staged, parent_out_dir_name is a staging directory, owned by the
+    caller (see output.StagedOutput), and written into as is. Otherwise,
+    output is staged, and published to parent_out_dir_name, replacing any
+    existing directory, once complete.
+
+    Returns a Stage for each stage run. If parent_out_dir_name is None,
+    nothing is written, and each Stage holds snapshots of its plates.'''
+    return list(iter_run(wrtrs, input_plates, plate_names,
+                         parent_out_dir_name, working_vol, io_workers,
+                         optimiser, existing, combined, parallel_threshold,
+                         staged))
+
+
+def iter_run(wrtrs, input_plates=None, plate_names=None,
+             parent_out_dir_name='.', working_vol=None, io_workers=4,
+             optimiser=smart_sort_opt, existing=None, combined=False,
+             parallel_threshold=worklist.PARALLEL_THRESHOLD, staged=False):
+    '''Run pipeline, as run, yielding the Stage of each stage as soon as it
+    is run, while its files may still be being written.'''
     if not plate_names:
         plate_names = {}
 
-    parent_out_dir = os.path.abspath(parent_out_dir_name)
+    stages = _get_stages(wrtrs)
+    added_comps = None
+
+    if combined:
+        pipeline_graph = dag.PipelineGraph()
+
+        for name, writer in stages:
+            pipeline_graph.set_stage(name)
+            writer.write(pipeline_graph)
+
+        graphs = [pipeline_graph.get_view(name) for name, _ in stages]
+        added_comps = {}
+    else:
+        graphs = [writer.get_graph() for _, writer in stages]
+
+    if working_vol:
+        validate.check(worklist.get_working_vol_violations(graphs,
+                                                           working_vol))
+
+    replicates = worklist.get_replicates(graphs, working_vol) \
+        if working_vol else {}
 
-    if os.path.exists(parent_out_dir):
-        shutil.rmtree(parent_out_dir)
+    # Nanolitres drawn per (plate, well), shared to balance across stages:
+    drawn_vols = defaultdict(int)
+
+    if parent_out_dir_name is None or staged:
+        out_dir_context = nullcontext(parent_out_dir_name)
+    else:
+        out_dir_context = StagedOutput(parent_out_dir_name)
+
+    with out_dir_context as parent_out_dir, OutputWriter(io_workers) as output:
+        for (name, writer), graph in zip(stages, graphs):
+            worklist_gen = worklist.WorklistGenerator(graph,
+                                                      replicates,
+                                                      drawn_vols,
+                                                      optimiser,
+                                                      existing,
+                                                      added_comps,
+                                                      parallel_threshold)
+
+            plate_names['output'] = writer.get_output_name()
+
+            plates, result = _run_writer(worklist_gen, name, input_plates,
+                                         plate_names, parent_out_dir, output)
+            input_plates.update(plates)
+            yield result
+
+
+def _get_stages(wrtrs):
+    '''Get (name, writer) pairs, flattening parallel writers.'''
+    stages = []
 
     for idx, writers in enumerate(wrtrs):
         if isinstance(writers, list):
             for wrt_idx, writer in enumerate(writers):
-                input_plates.update(_run_writer(writer,
-                                                str(idx + 1) + '_' +
-                                                str(wrt_idx + 1),
-                                                input_plates,
-                                                plate_names,
-                                                parent_out_dir))
+                stages.append((str(idx + 1) + '_' + str(wrt_idx + 1),
+                               writer))
         else:
-            input_plates.update(_run_writer(writers,
-                                            str(idx + 1),
-                                            input_plates,
-                                            plate_names,
-                                            parent_out_dir))
+            stages.append((str(idx + 1), writers))
 
+    return stages
 
-def _run_writer(writer, name, input_plates, plate_names,
-                parent_out_dir):
-    '''Run a writer.'''
-    out_dir = os.path.join(parent_out_dir, name)
-    os.makedirs(out_dir)
 
-    worklist_gen = worklist.WorklistGenerator(writer.get_graph())
-    plate_names['output'] = writer.get_output_name()
+def _run_writer(worklist_gen, name, input_plates, plate_names,
+                parent_out_dir, output):
+    '''Run a writer, via its worklist generator.'''
     wrklsts, plates = worklist_gen.get_worklist(input_plates, plate_names)
+    summary_df = _summarise(wrklsts)
+
+    if not parent_out_dir:
+        # Snapshot plates, as later stages may modify them:
+        return plates, Stage(name, wrklsts,
+                             {plt_name: plt.copy()
+                              for plt_name, plt in plates.items()},
+                             summary_df)
+
+    out_dir = os.path.join(parent_out_dir, name)
+    os.makedirs(os.path.join(out_dir, 'plates'))
 
     for plt in plates.values():
-        plt.to_csv(os.path.join(out_dir, 'plates'))
+        output.write_plate(plt, os.path.join(out_dir, 'plates'))
 
     for wrklst in wrklsts:
-        worklist.to_csv(wrklst, out_dir)
+        output.submit(worklist.to_csv, wrklst, out_dir)
 
-    summary_df = _summarise(wrklsts)
-    summary_df.to_csv(os.path.join(out_dir, 'input_summary.csv'), index=False)
+    output.submit(summary_df.to_csv,
+                  os.path.join(out_dir, 'input_summary.csv'), index=False)
 
-    return plates
+    return plates, Stage(name, wrklsts, plates, summary_df)
 
 
 def _summarise(worklists):
-    '''Summarise worklists.'''
+    '''Summarise worklists, totalling volumes exactly in nanolitres.'''
     vols = {}
     dest_plates = set()
 
@@ -104,9 +226,10 @@ def _summarise(worklists):
             if keys not in vols:
                 vols[keys] = 0
 
-            vols[keys] += group_df['Volume'].sum()
+            vols[keys] += volume.to_nl(group_df['Volume']).sum()
 
-    out = [list(key) + [value, None] for key, value in vols.items()]
+    out = [list(key) + [volume.to_ul(value), None]
+           for key, value in vols.items()]
 
     for dest_plate in dest_plates:
         out.append([None, None, None, None, dest_plate])
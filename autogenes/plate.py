@@ -9,18 +9,36 @@ To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
 '''
 # pylint: disable=invalid-name
 # pylint: disable=too-many-arguments
+from functools import lru_cache
 import itertools
 import math
 import os
+import re
 
+import numpy as np
 import pandas as pd
 
+# Standard (rows, cols) of 96, 384 and 1536 well plates:
+SHAPES = [(8, 12), (16, 24), (32, 48)]
+
+# Properties held in plates, others being held in a shared Store:
+PLATE_PROPERTIES = ['id', 'parent']
+
+# Versions of plates, unique over all plates and their modifications:
+_VERSIONS = itertools.count()
+
+_WELL_RE = re.compile(r'([A-Z]+)(\d+)$')
+
 
 class Plate():
-    '''Class to represent a well plate.'''
+    '''Class to represent a well plate.
+
+    Bulky properties of its objects may be held in a Store, shared between
+    plates, keyed by (plate name, well name), and are joined when objects are
+    got or the plate is exported.'''
 
     def __init__(self, name, rows=8, cols=12, col_ord=False, properties=None,
-                 plate=None):
+                 plate=None, store=None):
 
         if not properties:
             properties = ['id']
@@ -33,12 +51,19 @@ class Plate():
         if plate is not None:
             self.__plate = plate
         else:
-            self.__plate = pd.DataFrame(index=[chr(r + ord('A'))
+            self.__plate = pd.DataFrame(index=[get_row_name(r)
                                                for r in range(0, rows)],
                                         columns=columns)
         self.__plate.name = name
         self.__col_ord = col_ord
-        self.__next = 0
+        self.__store = store
+        self.__version = next(_VERSIONS)
+
+        # Continue after any existing contents:
+        self.__next = max([self.get_idx(row, col) + 1
+                           for row, col in zip(*np.nonzero(
+                               pd.notnull(self.__plate['id']).values))],
+                          default=0)
 
     def get_name(self):
         '''Get name.'''
@@ -52,6 +77,15 @@ class Plate():
         '''Get properties.'''
         return list(self._Plate__plate.columns.levels[0])
 
+    def get_store(self):
+        '''Get store of bulky properties, if any.'''
+        return self.__store
+
+    def get_version(self):
+        '''Get version, which changes whenever the plate is modified, and
+        is never shared with another plate.'''
+        return self.__version
+
     def shape(self):
         '''Get plate shape.'''
         return self.__plate['id'].shape
@@ -64,6 +98,7 @@ class Plate():
     def set(self, obj, row, col):
         '''Set object at a given row, col.'''
         self.__next = max(self.__next, self.get_idx(row, col) + 1)
+        self.__version = next(_VERSIONS)
 
         for key, val in obj.items():
             self.__plate.loc[:, (key, col + 1)][row] = val
@@ -72,9 +107,15 @@ class Plate():
         '''Get object at a given row, col.'''
         keys = self.get_properties()
 
-        return {key: self._Plate__plate.loc[:, (key, col + 1)][row]
-                for key in keys
-                if _is_value(self._Plate__plate.loc[:, (key, col + 1)][row])}
+        obj = {key: self._Plate__plate.loc[:, (key, col + 1)][row]
+               for key in keys
+               if _is_value(self._Plate__plate.loc[:, (key, col + 1)][row])}
+
+        if self.__store is not None and obj:
+            obj.update(self.__store.get((self.get_name(),
+                                         get_well_name(row, col))))
+
+        return obj
 
     def get_all(self):
         '''Get all objects.'''
@@ -92,6 +133,7 @@ class Plate():
         '''Adds an object to the next well.'''
         if well_name:
             row, col = get_indices(well_name)
+            self.__version = next(_VERSIONS)
 
             for key, val in obj.items():
                 self.__plate.loc[:, (key, col + 1)][row] = val
@@ -102,17 +144,24 @@ class Plate():
 
     def add_line(self, obj):
         '''Adds a line of objects (row or col) in next empty line.'''
-        if self.__col_ord:
-            line_len = len(self.__plate.columns)
-        else:
-            line_len = len(self.__plate.index)
-
+        line_len = self.get_line_len()
         start = ((self.__next + line_len - 1) // line_len) * line_len
 
         for idx in range(start, start + line_len):
             row, col = self.get_row_col(idx)
             self.set(obj, row, col)
 
+    def get_line_len(self):
+        '''Get number of wells in a line (row or col).'''
+        if self.__col_ord:
+            return len(self.__plate.columns)
+
+        return len(self.__plate.index)
+
+    def capacity(self):
+        '''Get number of empty wells following the last filled well.'''
+        return self.size() - self.__next
+
     def find(self, src_terms):
         '''Finds an object.'''
         wells = [[str(row) + str(col)
@@ -136,15 +185,49 @@ class Plate():
         '''Map row, col to idx.'''
         return get_idx(row, col, self.__plate.shape, self.__col_ord)
 
+    def copy(self):
+        '''Get a copy of the plate.'''
+        plt = Plate(self.get_name(), col_ord=self.__col_ord,
+                    plate=self.__plate.copy(), store=self.__store)
+        plt.__next = self.__next
+        return plt
+
     def to_csv(self, out_dir_name='.'):
-        '''Export plate to csv.'''
+        '''Export plate to csv, joining stored properties.'''
         if not os.path.exists(out_dir_name):
             os.makedirs(out_dir_name)
 
         filepath = os.path.abspath(os.path.join(out_dir_name,
                                                 str(self.__plate.name) +
                                                 '.csv'))
-        self.__plate.to_csv(filepath, encoding='utf-8')
+        self.__join().to_csv(filepath, encoding='utf-8')
+
+    def __join(self):
+        '''Get plate with stored properties of its objects.'''
+        if self.__store is None:
+            return self.__plate
+
+        rows, cols = self.shape()
+        grids = [self.__plate]
+
+        for prop in self.__store.get_properties():
+            values = self.__store.get_values(prop)
+            data = np.full((rows, cols), np.nan, dtype=object)
+
+            for row in range(rows):
+                for col in range(cols):
+                    data[row, col] = values.get(
+                        (self.get_name(), get_well_name(row, col)), np.nan)
+
+            if pd.notnull(data).any():
+                grids.append(pd.DataFrame(
+                    data, index=self.__plate.index,
+                    columns=pd.MultiIndex.from_product(
+                        [[prop], range(1, cols + 1)])))
+
+        plate_df = pd.concat(grids, axis=1)
+        plate_df.name = self.__plate.name
+        return plate_df
 
     def __set(self, obj, idx):
         '''Sets an object in the given well.'''
@@ -157,17 +240,17 @@ class Plate():
 
 
 def get_row_col(idx, shape=(8, 12), col_ord=False):
-    '''Map idx to well.'''
+    '''Map idx (or array of idx) to well.'''
     rows, cols = shape
 
     if col_ord:
-        return int(idx / cols), int(idx % cols)
+        return idx // cols, idx % cols
 
-    return int(idx % rows), int(idx / rows)
+    return idx % rows, idx // rows
 
 
 def get_idx(row, col, shape=(8, 12), col_ord=False):
-    '''Map idx to well, column ordered.'''
+    '''Map idx (or arrays of idx) to well, column ordered.'''
     rows, cols = shape
 
     if col_ord:
@@ -176,14 +259,67 @@ def get_idx(row, col, shape=(8, 12), col_ord=False):
     return col * rows + row
 
 
+def get_shape(n_wells, max_row=0, max_col=0):
+    '''Get shape of smallest standard plate holding n_wells, and wells at
+    up to max_row and max_col.'''
+    for rows, cols in SHAPES:
+        if n_wells <= rows * cols and max_row < rows and max_col < cols:
+            return rows, cols
+
+    raise ValueError('No plate holds %d wells' % n_wells)
+
+
+@lru_cache(maxsize=None)
 def get_indices(well_name):
-    '''Get indices from well name.'''
-    return ord(well_name[0]) - ord('A'), int(well_name[1:]) - 1
+    '''Get indices from well name, e.g. AF48.'''
+    match = _WELL_RE.match(well_name)
+
+    if not match:
+        raise ValueError('Invalid well name: %s' % well_name)
+
+    row = 0
+
+    for letter in match.group(1):
+        row = row * 26 + ord(letter) - ord('A') + 1
+
+    return row - 1, int(match.group(2)) - 1
 
 
 def get_well_name(row, col):
     '''Get well name from indices.'''
-    return str(chr(row + ord('A'))) + str(col + 1)
+    return get_row_name(row) + str(col + 1)
+
+
+@lru_cache(maxsize=None)
+def get_row_name(row):
+    '''Get row name, i.e. A-Z then AA, AB...'''
+    name = ''
+    row += 1
+
+    while row:
+        row, rem = divmod(row - 1, 26)
+        name = chr(rem + ord('A')) + name
+
+    return name
+
+
+def get_well_indices(well_names):
+    '''Get arrays of rows and cols from an array of well names.'''
+    names = pd.Series(well_names, dtype=object)
+    codes, uniques = pd.factorize(names)
+    indices = np.array([get_indices(name) for name in uniques],
+                       dtype=int).reshape(-1, 2)
+    return indices[codes, 0], indices[codes, 1]
+
+
+def get_well_names(rows, cols):
+    '''Get array of well names from arrays of rows and cols.'''
+    rows = np.asarray(rows, dtype=int)
+    cols = np.asarray(cols, dtype=int)
+    row_names = np.array([get_row_name(row)
+                          for row in range(rows.max(initial=0) + 1)],
+                         dtype=object)
+    return row_names[rows] + (cols + 1).astype(str).astype(object)
 
 
 def find(plates, obj):
@@ -199,8 +335,9 @@ def find(plates, obj):
     return found
 
 
-def add_component(component, plate_id, is_reagent, plates, well_name):
-    '''Add a component to a plate.'''
+def add_component(component, plate_id, is_reagent, plates, well_name,
+                  replicates=1):
+    '''Add a component to a plate, replicated over a number of wells.'''
     for plate in plates.values():
         wells = plate.find(component)
 
@@ -217,37 +354,68 @@ def add_component(component, plate_id, is_reagent, plates, well_name):
         if well_name:
             return [plate.add(component, well_name)], plate
         # else:
-        plate.add_line(component)
+        line_len = plate.get_line_len()
+
+        for _ in range((replicates + line_len - 1) // line_len):
+            plate.add_line(component)
+
         return add_component(component, plate_id, is_reagent, plates,
                              well_name)
 
-    return [plate.add(component, well_name)], plate
+    if well_name or replicates == 1:
+        return [plate.add(component, well_name)], plate
 
+    if plate.capacity() < replicates:
+        # Keep replicates together on a single plate:
+        raise KeyError(plate_id)
 
-def from_table(df, name):
-    '''Generate Plate from tabular data.'''
+    return [plate.add(component) for _ in range(replicates)], plate
+
+
+def from_table(df, name, store=None):
+    '''Generate Plate from tabular data.
+
+    Empty columns are dropped. If a store is given, properties other than
+    PLATE_PROPERTIES are added to it, by (plate name, well name), rather
+    than to the plate.'''
     # df = pd.read_csv(filename, dtype={'id': object, 'parent': object})
+    df = df.dropna(axis=1, how='all').copy()
     df['id'] = df['id'].astype(str)
 
     if 'parent' in df.columns.values:
         df['parent'] = df['parent'].astype(str)
 
-    # 96 or 384?
-    if len(df) > 96:
-        rows, cols = 16, 24
-    else:
-        rows, cols = 8, 12
+    well_rows, well_cols = get_well_indices(df['well'].values)
+    rows, cols = get_shape(len(df),
+                           well_rows.max(initial=0),
+                           well_cols.max(initial=0))
 
     props = list(df.columns[df.columns != 'well'])
 
-    plt = Plate(name.split('.')[0], rows=rows, cols=cols, properties=props)
+    if store is not None:
+        stored = [prop for prop in props if prop not in PLATE_PROPERTIES]
+
+        for well_name, obj in zip(get_well_names(well_rows, well_cols),
+                                  df[stored].to_dict('records')):
+            store.add((name.split('.')[0], well_name),
+                      {key: val for key, val in obj.items()
+                       if _is_value(val)})
+
+        props = [prop for prop in props if prop not in stored]
 
-    for _, row in df.iterrows():
-        dct = row.to_dict()
-        well = dct.pop('well')
-        plt.add(dct, well)
+    # Lay out each property as a rows x cols grid:
+    data = np.full((rows, len(props) * cols), np.nan, dtype=object)
 
-    return plt
+    for prop_idx, prop in enumerate(props):
+        data[well_rows, prop_idx * cols + well_cols] = df[prop].values
+
+    plate_df = pd.DataFrame(data,
+                            index=[get_row_name(r) for r in range(rows)],
+                            columns=pd.MultiIndex.from_tuples(
+                                itertools.product(props,
+                                                  range(1, cols + 1))))
+
+    return Plate(name.split('.')[0], plate=plate_df, store=store)
 
 
 def from_plate(df, name):
@@ -258,6 +426,14 @@ def from_plate(df, name):
     return Plate(name.split('.')[0], plate=df)
 
 
+def from_map(df, name):
+    '''Generate Plate from a plate map, as written by Plate.to_csv.'''
+    df = df.astype(object)
+    df.columns = pd.MultiIndex.from_tuples([(key, int(col))
+                                            for key, col in df.columns])
+    return Plate(name.split('.')[0], plate=df)
+
+
 def _is_value(val):
     '''Return boolean depending on whether value is None or NaN.'''
     return bool(val and not (isinstance(val, float) and math.isnan(val)))
@@ -8,7 +8,8 @@ To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
 @author: neilswainston
 '''
 # pylint: disable=too-few-public-methods
-from autogenes.graph_writer import GraphWriter
+from autogenes.graph_writer import GraphWriter, get_vol_violations
+from autogenes.volume import Volume
 
 
 class MutOligoPoolWriter(GraphWriter):
@@ -16,13 +17,18 @@ class MutOligoPoolWriter(GraphWriter):
 
     def __init__(self, wt_mut, oligo_vol, output_name):
         self.__wt_mut = wt_mut
-        self.__oligo_vol = oligo_vol
+        self.__oligo_vol = Volume.from_ul(oligo_vol)
         GraphWriter.__init__(self, output_name)
 
+    def get_violations(self, min_vol):
+        return get_vol_violations('Oligo', [self.__oligo_vol.to_ul()],
+                                  [self.get_output_name()], min_vol)
+
     def _initialise(self):
         for wt_id, mut_ids in self.__wt_mut.items():
             pool = self._add_vertex(str(wt_id) + 'm', {'is_reagent': False})
 
             for mut_id in mut_ids:
                 oligo = self._add_vertex(mut_id, {'is_reagent': False})
-                self._add_edge(oligo, pool, {'Volume': self.__oligo_vol})
+                self._add_edge(oligo, pool,
+                               {'Volume': self.__oligo_vol.to_ul()})
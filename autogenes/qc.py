@@ -0,0 +1,183 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-locals
+from collections import Counter
+import sys
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+from autogenes import assembly, pipeline, run, validate
+from autogenes.graph_writer import Violation
+import numpy as np
+import pandas as pd
+
+
+# 2-bit codes of unambiguous bases, with 4 for any other character:
+_CODES = np.full(256, 4, dtype=np.uint8)
+_CODES[[ord(base) for base in 'ACGT']] = np.arange(4, dtype=np.uint8)
+
+
+def check_oligos(oligos, mutant_oligos, designs, seqs, mutant_seqs,
+                 min_overlap=12, min_tm=40.0, k=12, min_shared=3):
+    '''Get Violations of oligo sequences.
+
+    The overlap of every pair of oligos adjacent in any design must be at
+    least min_overlap long, with a melting temperature of at least min_tm.
+    Oligos more than one position apart must not share min_shared or more
+    k-mers, on either strand, as they may then misprime.'''
+    missing = [oligo_id for oligo_id in oligos if oligo_id not in seqs]
+
+    if missing:
+        return [Violation('missing_sequence', oligo_id, None,
+                          'Oligo has no sequence')
+                for oligo_id in missing]
+
+    oriented = assembly.Assembler(oligos, seqs, mutant_seqs,
+                                  min_overlap=1).get_seqs()
+
+    violations = []
+
+    for prev, nxt in sorted(get_adjacent_pairs(designs)):
+        overlap = assembly.get_overlap(oriented[prev], oriented[nxt])
+        subject = prev + '/' + nxt
+
+        if overlap < min_overlap:
+            violations.append(Violation('short_overlap', subject, overlap,
+                                        'Overlap is shorter than %d' %
+                                        min_overlap))
+        else:
+            tm = get_tm(oriented[nxt][:overlap])
+
+            if tm < min_tm:
+                violations.append(Violation('low_tm', subject, round(tm, 1),
+                                            'Overlap melts below %.1f' %
+                                            min_tm))
+
+    positions = {oligo_id: idx for idx, oligo_id in enumerate(oligos)}
+    indexed = [(positions[oligo_id], seqs[oligo_id]) for oligo_id in oligos]
+    indexed.extend((positions[parent], seq)
+                   for parent in mutant_oligos
+                   for seq in mutant_seqs.get(parent, []))
+
+    for (pos, other), count in sorted(
+            get_shared_kmers([seq for _, seq in indexed],
+                             [pos for pos, _ in indexed], k).items()):
+        if other - pos > 1 and count >= min_shared:
+            violations.append(Violation('off_target',
+                                        oligos[pos] + '/' + oligos[other],
+                                        count,
+                                        'Non-adjacent oligos share %d-mers' %
+                                        k))
+
+    return violations
+
+
+def get_adjacent_pairs(designs):
+    '''Get pairs of oligos adjacent in any design, within or between
+    blocks.'''
+    pairs = set()
+
+    for design in designs:
+        flat = [oligo_id for block in design for oligo_id in block]
+        pairs.update(zip(flat, flat[1:]))
+
+    return pairs
+
+
+def get_tm(seq):
+    '''Get melting temperature proxy: the Wallace rule below 14 bases, and
+    the GC content approximation otherwise. Ambiguous bases count as half
+    GC.'''
+    seq = seq.upper()
+    gc = sum(seq.count(base) for base in 'GCS')
+    at = sum(seq.count(base) for base in 'ATW')
+    gc += (len(seq) - gc - at) / 2.0
+    at = len(seq) - gc
+
+    if len(seq) < 14:
+        return 2 * at + 4 * gc
+
+    return 64.9 + 41 * (gc - 16.4) / len(seq)
+
+
+def get_shared_kmers(seqs, owners, k=12):
+    '''Get number of distinct canonical k-mers shared by each pair of owners,
+    keyed by (lower owner, higher owner).
+
+    All sequences are encoded and indexed in one batch; k-mers containing
+    ambiguous bases are ignored.'''
+    kmers, kmer_owners = get_kmers(seqs, owners, k)
+
+    # Distinct (k-mer, owner), sorted by k-mer:
+    order = np.lexsort((kmer_owners, kmers))
+    kmers, kmer_owners = kmers[order], kmer_owners[order]
+    keep = np.ones(len(kmers), dtype=bool)
+    keep[1:] = (kmers[1:] != kmers[:-1]) | \
+        (kmer_owners[1:] != kmer_owners[:-1])
+    kmers, kmer_owners = kmers[keep], kmer_owners[keep]
+
+    # K-mers held by more than one owner:
+    starts = np.flatnonzero(np.r_[True, kmers[1:] != kmers[:-1]])
+    counts = np.diff(np.r_[starts, len(kmers)])
+    shared = Counter()
+
+    for start, count in zip(starts[counts > 1], counts[counts > 1]):
+        group = kmer_owners[start:start + count].tolist()
+        shared.update((group[idx], other)
+                      for idx in range(len(group))
+                      for other in group[idx + 1:])
+
+    return shared
+
+
+def get_kmers(seqs, owners, k=12):
+    '''Get canonical (the lesser of either strand) 2-bit encoded k-mers of
+    sequences, and the owner of each.'''
+    if not seqs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # Concatenate, separated by an ambiguous base:
+    text = '\x00'.join(seq.upper() for seq in seqs) + '\x00'
+    codes = _CODES[np.frombuffer(text.encode('ascii'), dtype=np.uint8)]
+    seq_owners = np.repeat(np.asarray(owners, dtype=np.int64),
+                           [len(seq) + 1 for seq in seqs])
+
+    if len(codes) < k:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    windows = sliding_window_view(codes, k)
+    valid = (windows < 4).all(axis=1)
+    windows = windows[valid].astype(np.int64)
+    shifts = 2 * np.arange(k - 1, -1, -1, dtype=np.int64)
+    fwd = (windows << shifts).sum(axis=1)
+    rev = ((3 - windows[:, ::-1]) << shifts).sum(axis=1)
+
+    return np.minimum(fwd, rev), seq_owners[:len(valid)][valid]
+
+
+def main(args):
+    '''main method.'''
+    input_plates = pipeline.get_input_plates(args[0])
+    oligos, mutant_oligos, _, designs = \
+        run.get_designs(input_plates, int(args[1]), int(args[2]))
+    seqs, mutant_seqs = assembly.get_sequences(input_plates)
+
+    violations = check_oligos(oligos, mutant_oligos, designs, seqs,
+                              mutant_seqs)
+
+    pd.set_option('display.width', 200)
+    print(validate.to_df(violations).to_string(index=False)
+          if violations else 'No violations')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -7,6 +7,7 @@ To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
 
 @author: neilswainston
 '''
+import argparse
 from collections import defaultdict
 import itertools
 import os
@@ -15,44 +16,227 @@ from time import gmtime, strftime
 
 from synbiochem import utils
 
-from autogenes import pipeline, worklist
+from autogenes import get_design_id
+from autogenes import assembly, design, dispense, lineage, optimisers, \
+    picklist, pipeline, qc, schedule, validate, worklist
 from autogenes.block import InnerBlockPoolWriter, BlockPcrWriter, \
     BlockPoolWriter
 from autogenes.dilution import WtOligoDilutionWriter
 from autogenes.gene import CombiGenePcrWriter
+from autogenes.output import POLICIES, StagedOutput
 from autogenes.pool import MutOligoPoolWriter
 
 
-def run(plate_dir, max_mutated, n_blocks, out_dir_parent, exp_name):
-    '''run method.'''
+def run(plate_dir, max_mutated, n_blocks, out_dir_parent, exp_name,
+        working_vol=None, n_procs=1, optimiser='smart_sort',
+        extend_dir=None, combined=False, min_vol=0.5, fasta=None,
+        min_reactions=False, publish='replace', check_seqs=False,
+        batch_plates=False, n_samples=None, seed=0,
+        parallel_threshold=worklist.PARALLEL_THRESHOLD, max_tip_vol=None,
+        n_robots=None):
+    '''run method.
+
+    If extend_dir, a previous run's output, is given, only the designs not
+    in that run's library, and the transfers needed to make them, are
+    generated, placing new components in free wells of its plates. New
+    blocks are pooled in new pools, as existing ones have been used, and
+    any other addition to an existing component is refused.
+
+    Inputs and writer parameters are validated before any output is
+    written, raising a ValueError listing every violation, including any
+    transfer volumes below min_vol.
+
+    If fasta is given, the assembled sequence of every design is written to
+    this file (gzipped if it ends .gz) in the output directory.
+
+    If min_reactions, block boundaries are chosen to minimise the number of
+    unique block PCRs, rather than splitting oligos into blocks of almost
+    equal length, and the reactions saved are reported.
+
+    If n_samples is given, a reproducible sample of that many designs,
+    stratified by number of mutations and their block positions, is used
+    rather than every design (see design.sample_designs).
+
+    If check_seqs, oligo sequences are checked for short or low melting
+    temperature overlaps and off-target annealing (see qc.check_oligos),
+    raising a ValueError listing every violation.
+
+    If batch_plates, each stage's worklist is reordered into blocks of
+    transfers between the same source and destination plates, minimising
+    plate swaps (see picklist.batch), and the swaps saved are reported.
+
+    Stages of at least parallel_threshold transfers are optimised in
+    parallel (see worklist.optimise).
+
+    If max_tip_vol is given, consecutive reagent transfers from the same
+    well are also written as multi-dispenses of up to this volume, to
+    multi_dispense.csv (see dispense.consolidate), and the aspirates saved
+    are reported.
+
+    If n_robots is given, each stage's worklist is also split across this
+    many liquid handlers, balancing estimated time (see schedule.split),
+    and the estimated times are reported.
+
+    A lineage index of the components and wells in each design's lineage
+    is written to lineage.npz (see lineage.build).
+
+    Output is staged and published atomically, with a manifest of checksums,
+    according to the publish policy (see output.StagedOutput). Returns the
+    output directory.'''
     assert len(exp_name) < 6
 
     dte = strftime("%y%m%d", gmtime())
 
     input_plates = pipeline.get_input_plates(plate_dir)
-    oligos, mutant_oligos, primers = _read_plates(input_plates)
-    designs = _combine(oligos, mutant_oligos, max_mutated, n_blocks)
+    baseline = pipeline.get_run_plates(extend_dir) if extend_dir else None
+    existing, previous, pools = _get_previous(extend_dir, baseline) \
+        if extend_dir else (None, None, None)
+    oligos, mutant_oligos, primers, designs = \
+        get_designs(input_plates, max_mutated, n_blocks, n_procs,
+                    min_reactions, n_samples, seed, previous)
+
+    if check_seqs:
+        seqs, mutant_seqs = assembly.get_sequences(input_plates)
+        validate.check(qc.check_oligos(oligos, mutant_oligos, designs, seqs,
+                                       mutant_seqs))
+
+    if min_reactions and designs:
+        _report_block_pcrs(oligos, mutant_oligos, max_mutated, n_blocks,
+                           designs)
+
+    if extend_dir:
+        # Current input plates take precedence over the baseline's copies:
+        baseline.update(input_plates)
+        input_plates = baseline
+
+    writers = get_writers(oligos, mutant_oligos, primers, designs, exp_name,
+                          pools)
+
+    validate.check(validate.validate_writers(writers, min_vol))
+
+    out_dir_name = os.path.join(out_dir_parent, dte + exp_name)
+
+    if extend_dir and \
+            os.path.abspath(extend_dir) == os.path.abspath(out_dir_name):
+        raise ValueError('Cannot extend %s in place' % extend_dir)
+
+    staged = StagedOutput(out_dir_name, publish)
+
+    with staged as staged_dir:
+        stages = pipeline.run(writers, input_plates,
+                              parent_out_dir_name=staged_dir,
+                              working_vol=working_vol,
+                              optimiser=optimisers.get_optimiser(optimiser),
+                              existing=existing,
+                              combined=combined,
+                              parallel_threshold=parallel_threshold,
+                              staged=True)
+
+        lineage.build(stages, designs).save(os.path.join(staged_dir,
+                                                         'lineage.npz'))
+
+        worklist.format_worklist(staged_dir)
+
+        if batch_plates:
+            print(picklist.batch_dir(staged_dir).to_string(index=False))
 
-    writers = [
+        if max_tip_vol:
+            print(dispense.consolidate_dir(staged_dir, max_tip_vol)
+                  .to_string(index=False))
+
+        if n_robots:
+            print(schedule.split_dir(staged_dir, n_robots)
+                  .to_string(index=False))
+
+        if fasta:
+            seqs, mutant_seqs = assembly.get_sequences(input_plates)
+            assembly.write_fasta(designs,
+                                 assembly.Assembler(oligos, seqs,
+                                                    mutant_seqs),
+                                 os.path.join(staged_dir, fasta))
+
+    return staged.get_path()
+
+
+def get_designs(input_plates, max_mutated, n_blocks, n_procs=1,
+                min_reactions=False, n_samples=None, seed=0, previous=None):
+    '''Validate input plates and design combinatorial assembly.
+
+    If previous, the design ids of a run being extended, are given, only
+    other designs are returned.'''
+    oligos, mutant_oligos, primers = _read_plates(input_plates)
+    validate.check(validate.validate_inputs(oligos, mutant_oligos, primers,
+                                            max_mutated, n_blocks,
+                                            n_samples) +
+                   validate.validate_extension(previous or [], n_blocks))
+
+    block_lengths = design.get_min_block_lengths(
+        oligos, mutant_oligos, max_mutated, n_blocks) \
+        if min_reactions else None
+
+    if n_samples:
+        designs = design.sample_designs(
+            oligos, mutant_oligos, max_mutated, n_samples,
+            block_lengths or design.get_block_lengths(len(oligos), n_blocks),
+            seed)
+    elif previous is not None:
+        designs = design.get_new_designs(
+            oligos, list(mutant_oligos), max_mutated,
+            block_lengths or design.get_block_lengths(len(oligos), n_blocks),
+            previous)
+    else:
+        designs = _combine(oligos, mutant_oligos, max_mutated, n_blocks,
+                           n_procs, block_lengths)
+
+    if previous is not None:
+        # Omit designs already made, e.g. when sampling:
+        previous = set(previous)
+        designs = [dsgn for dsgn in designs
+                   if get_design_id(dsgn) not in previous]
+
+    return oligos, mutant_oligos, primers, designs
+
+
+def get_writers(oligos, mutant_oligos, primers, designs, exp_name,
+                pools=None):
+    '''Get writers for each stage.
+
+    If pools, the block PCRs of each pool of a run being extended, are
+    given, new blocks are pooled in new pools (see block.get_pools).'''
+    return [
         WtOligoDilutionWriter(oligos + primers, designs, 20, 20, 200,
                               exp_name + '-wt-dil'),
         MutOligoPoolWriter(mutant_oligos, 10, exp_name + '-mut-pl'),
         InnerBlockPoolWriter(designs, 2.5, 5, exp_name + '-templ'),
         BlockPcrWriter(designs, 1.2, 1.5, 3, 25, exp_name + '-pcr1'),
-        BlockPoolWriter(designs, 2, 25, False, exp_name + '-wt-bk'),
-        BlockPoolWriter(designs, 2, 25, True, exp_name + '-mut-bk'),
+        BlockPoolWriter(designs, 2, 25, False, exp_name + '-wt-bk', pools),
+        BlockPoolWriter(designs, 2, 25, True, exp_name + '-mut-bk', pools),
         CombiGenePcrWriter(designs, 4, 1.5, 1.5, 3, 25,
                            [['5-primer_dil', False], ['28_dil', False]],
-                           exp_name + '-pcr2')
+                           exp_name + '-pcr2', pools)
 
     ]
 
-    out_dir_name = os.path.join(out_dir_parent, dte + exp_name)
 
-    pipeline.run(writers, input_plates,
-                 parent_out_dir_name=out_dir_name)
+def _get_previous(extend_dir, baseline):
+    '''Get components, design ids, and block PCRs of each block pool, of a
+    previous run, from its plates and lineage index.'''
+    filename = os.path.join(extend_dir, 'lineage.npz')
+
+    if not os.path.exists(filename):
+        raise ValueError('Cannot extend %s, which has no lineage index' %
+                         extend_dir)
+
+    existing = {obj['id']
+                for plt in baseline.values()
+                for obj in plt.get_all().values()}
 
-    worklist.format_worklist(out_dir_name)
+    index = lineage.load(filename)
+    pools = {pool_id: index.get_parents(pool_id)
+             for pool_id in existing
+             if pool_id.endswith('_p')}
+
+    return existing, index.get_designs(), pools
 
 
 def _read_plates(input_plates):
@@ -72,7 +256,22 @@ def _read_plates(input_plates):
     return oligos, mutant_oligos, primers
 
 
-def _combine(oligos, mutant_oligos, max_mutated, n_blocks):
+def _report_block_pcrs(oligos, mutant_oligos, max_mutated, n_blocks,
+                       designs):
+    '''Report block PCRs saved compared with blocks of equal length.'''
+    even = design.get_n_block_pcrs(
+        oligos, mutant_oligos, max_mutated,
+        design.get_block_lengths(len(oligos), n_blocks))
+    block_lengths = [len(block) for block in designs[0]]
+    n_pcrs = design.get_n_block_pcrs(oligos, mutant_oligos, max_mutated,
+                                     block_lengths)
+
+    print('Block lengths %s: %d block PCRs, saving %d of %d' %
+          (block_lengths, n_pcrs, even - n_pcrs, even))
+
+
+def _combine(oligos, mutant_oligos, max_mutated, n_blocks, n_procs=1,
+             block_lengths=None):
     '''Design combinatorial assembly.'''
 
     # Assertion sanity checks:
@@ -80,48 +279,86 @@ def _combine(oligos, mutant_oligos, max_mutated, n_blocks):
     assert len(oligos) / n_blocks >= 2
     assert mutant_oligos if max_mutated > 0 else True
 
+    if block_lengths is None:
+        block_lengths = design.get_block_lengths(len(oligos), n_blocks)
+
+    if n_procs > 1:
+        return list(design.iter_designs(oligos, list(mutant_oligos),
+                                        max_mutated, n_blocks, n_procs,
+                                        block_lengths=block_lengths))
+
     designs = []
 
     # Get combinations:
     for n_mutated in range(max_mutated + 1):
-        designs.extend(_get_combis(oligos, mutant_oligos, n_mutated, n_blocks))
+        designs.extend(_get_combis(oligos, mutant_oligos, n_mutated,
+                                   block_lengths))
 
     return designs
 
 
-def _get_combis(oligos, mutant_oligos, n_mutated, n_blocks):
+def _get_combis(oligos, mutant_oligos, n_mutated, block_lengths):
     '''Get combinations.'''
-    designs = []
+    positions = {oligo: idx for idx, oligo in enumerate(oligos)}
 
     for combi in itertools.combinations(list(mutant_oligos), n_mutated):
-        design = list(oligos)
-
-        for wt_id in combi:
-            design[design.index(wt_id)] = wt_id + 'm'
-
-        block_lengths = [0] * n_blocks
-
-        for idx in itertools.cycle(range(0, n_blocks)):
-            block_lengths[idx] = block_lengths[idx] + 2
-
-            if sum(block_lengths) == len(design):
-                break
-
-        idx = 0
-        blocks = []
-
-        for val in block_lengths:
-            blocks.append(design[idx: idx + val])
-            idx = idx + val
-
-        designs.append(blocks)
-
-    return designs
+        yield design.get_design(oligos, combi, block_lengths, positions)
 
 
 def main(args):
     '''main method.'''
-    run(args[0], int(args[1]), int(args[2]), args[3], args[4])
+    parser = argparse.ArgumentParser()
+    parser.add_argument('plate_dir')
+    parser.add_argument('max_mutated', type=int)
+    parser.add_argument('n_blocks', type=int)
+    parser.add_argument('out_dir')
+    parser.add_argument('exp_name')
+    parser.add_argument('--working-vol', type=float,
+                        help='maximum volume to draw from a source well')
+    parser.add_argument('--procs', type=int, default=1,
+                        help='processes used to enumerate designs')
+    parser.add_argument('--optimiser', default='smart_sort',
+                        choices=sorted(optimisers.OPTIMISERS),
+                        help='transfer ordering strategy')
+    parser.add_argument('--extend',
+                        help='previous run output directory to extend')
+    parser.add_argument('--combined', action='store_true',
+                        help='build all stages from a single graph')
+    parser.add_argument('--min-vol', type=float, default=0.5,
+                        help='minimum volume that can be transferred')
+    parser.add_argument('--fasta',
+                        help='filename to write assembled variants to')
+    parser.add_argument('--min-reactions', action='store_true',
+                        help='choose block boundaries to minimise block PCRs')
+    parser.add_argument('--publish', default='replace', choices=POLICIES,
+                        help='if the output directory exists, replace it, '
+                        'add a unique suffix, or replace it holding a lock')
+    parser.add_argument('--check-seqs', action='store_true',
+                        help='check oligo overlaps and off-target annealing')
+    parser.add_argument('--batch-plates', action='store_true',
+                        help='order transfers to minimise plate swaps')
+    parser.add_argument('--sample', type=int,
+                        help='number of designs to sample')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed for sampling designs')
+    parser.add_argument('--parallel-threshold', type=int,
+                        default=worklist.PARALLEL_THRESHOLD,
+                        help='minimum transfers in a stage to optimise in '
+                        'parallel')
+    parser.add_argument('--multi-dispense', type=float, metavar='MAX_TIP_VOL',
+                        help='also write reagent transfers as multi-dispenses '
+                        'of up to this volume')
+    parser.add_argument('--robots', type=int,
+                        help='number of liquid handlers to split stages '
+                        'across')
+    args = parser.parse_args(args)
+
+    run(args.plate_dir, args.max_mutated, args.n_blocks, args.out_dir,
+        args.exp_name, args.working_vol, args.procs, args.optimiser,
+        args.extend, args.combined, args.min_vol, args.fasta,
+        args.min_reactions, args.publish, args.check_seqs,
+        args.batch_plates, args.sample, args.seed,
+        args.parallel_threshold, args.multi_dispense, args.robots)
 
 
 if __name__ == '__main__':
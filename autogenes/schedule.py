@@ -0,0 +1,201 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+from collections import defaultdict
+import os
+import re
+import sys
+
+from autogenes import output, picklist, simulate
+import pandas as pd
+
+_ROBOT_RE = re.compile(r'(worklist|loading)_robot\d+\.csv$')
+
+
+def split(df, n_robots, model=simulate.DEFAULT_MODEL):
+    '''Split a formatted worklist across n_robots identical liquid handlers.
+
+    Destination plates are kept whole, and assigned, longest estimated time
+    first, to the robot that least increases the split time, then to the
+    least loaded, and then moved or swapped between robots while this
+    reduces the split time. Each robot's worklist keeps the original order
+    within each Phase: components made in the worklist are only used in a
+    later phase, which every robot should start only once all have finished
+    the previous one, so plates are balanced on their time in each phase.
+
+    Returns each robot's worklist, and the estimated time of the worklist
+    run serially and split.'''
+    df = df.assign(Phase=picklist.get_phases(df))
+    plate_times = defaultdict(dict)
+
+    for (plate, phase), time in _get_times(df, model).items():
+        plate_times[plate][phase] = time
+
+    # Phases run in turn, each taking as long as its slowest robot:
+    phase_loads = defaultdict(lambda: [0.0] * n_robots)
+    loads = [0.0] * n_robots
+    robots = {}
+
+    for plate in sorted(plate_times,
+                        key=lambda plate: (-sum(plate_times[plate].values()),
+                                           plate)):
+        _, _, robot = min((_get_increase(phase_loads, plate_times[plate],
+                                         robot), loads[robot], robot)
+                          for robot in range(n_robots))
+        robots[plate] = robot
+
+        for phase, time in plate_times[plate].items():
+            phase_loads[phase][robot] += time
+            loads[robot] += time
+
+    _rebalance(plate_times, robots, phase_loads, n_robots)
+
+    robot_ids = df['DestinationPlateBarcode'].map(robots).values
+    wrklsts = [df[robot_ids == robot].sort_values('Phase', kind='mergesort')
+               for robot in range(n_robots)]
+
+    return wrklsts, sum(loads), \
+        sum(max(robot_loads) for robot_loads in phase_loads.values())
+
+
+def get_loading(df, robot_plates=None):
+    '''Get plates to load to run a worklist, in order of first use, with
+    their role, first phase, and whether they are also used by other
+    robots (given the plates of each robot).'''
+    rows = []
+    seen = set()
+
+    for src_plate, dest_plate, phase in \
+            df[['SourcePlateBarcode', 'DestinationPlateBarcode',
+                'Phase']].values:
+        for plate, role in [(src_plate, 'source'),
+                            (dest_plate, 'destination')]:
+            if plate not in seen:
+                seen.add(plate)
+                rows.append([plate, role, phase,
+                             sum(plate in plates
+                                 for plates in robot_plates or []) > 1])
+
+    return pd.DataFrame(rows, columns=['plate', 'role', 'phase', 'shared'])
+
+
+def split_dir(run_dir_name, n_robots, model=simulate.DEFAULT_MODEL):
+    '''Split each stage's worklist.csv in a run directory across n_robots,
+    writing worklist_robot<n>.csv and loading_robot<n>.csv for each robot,
+    and reporting estimated times.'''
+    report = []
+
+    for dirpath, _, filenames in sorted(os.walk(run_dir_name)):
+        if 'worklist.csv' in filenames:
+            # Remove any earlier split:
+            for filename in filenames:
+                if _ROBOT_RE.match(filename):
+                    os.remove(os.path.join(dirpath, filename))
+
+            df = pd.read_csv(os.path.join(dirpath, 'worklist.csv'))
+            wrklsts, serial, parallel = split(df, n_robots, model)
+            robot_plates = [set(wrklst['SourcePlateBarcode']) |
+                            set(wrklst['DestinationPlateBarcode'])
+                            for wrklst in wrklsts]
+
+            for robot, wrklst in enumerate(wrklsts):
+                wrklst.to_csv(os.path.join(dirpath, 'worklist_robot%d.csv' %
+                                           (robot + 1)), index=False)
+                get_loading(wrklst, robot_plates).to_csv(
+                    os.path.join(dirpath,
+                                 'loading_robot%d.csv' % (robot + 1)),
+                    index=False)
+
+            report.append([os.path.relpath(dirpath, run_dir_name), serial,
+                           parallel,
+                           serial / parallel if parallel else 1.0])
+
+    return pd.DataFrame(report, columns=['stage', 'serial_time',
+                                         'split_time', 'speedup'])
+
+
+def _get_times(df, model):
+    '''Get estimated time of each destination plate's transfers in each
+    phase, run alone.'''
+    return {key: simulate.simulate(group_df, model)['time'].sum()
+            for key, group_df in df.groupby(['DestinationPlateBarcode',
+                                             'Phase'], sort=False)}
+
+
+def _get_increase(phase_loads, times, robot):
+    '''Get increase in split time of adding a plate's time in each phase to
+    a robot.'''
+    return sum(max(0.0, phase_loads[phase][robot] + time -
+                   max(phase_loads[phase]))
+               for phase, time in times.items())
+
+
+def _rebalance(plate_times, robots, phase_loads, n_robots):
+    '''Move plates to other robots, or swap them with other robots' plates,
+    while this reduces the split time.'''
+    plates = sorted(plate_times)
+    improved = True
+
+    while improved:
+        improved = False
+
+        for plate in plates:
+            # Moves to each robot, and swaps with each other plate:
+            for robot, other in [(robot, None)
+                                 for robot in range(n_robots)] + \
+                    [(robots[other], other) for other in plates]:
+                if robot == robots[plate]:
+                    continue
+
+                moves = [(plate, robot)]
+
+                if other:
+                    moves.append((other, robots[plate]))
+
+                phases = {phase
+                          for moved, _ in moves
+                          for phase in plate_times[moved]}
+                split_time = sum(max(phase_loads[phase]) for phase in phases)
+                undo = _move(plate_times, robots, phase_loads, moves)
+
+                if sum(max(phase_loads[phase]) for phase in phases) < \
+                        split_time - 1e-9:
+                    improved = True
+                else:
+                    _move(plate_times, robots, phase_loads, undo)
+
+
+def _move(plate_times, robots, phase_loads, moves):
+    '''Move plates to robots, returning the moves that undo this.'''
+    undo = [(plate, robots[plate]) for plate, _ in moves]
+
+    for plate, robot in moves:
+        for phase, time in plate_times[plate].items():
+            phase_loads[phase][robots[plate]] -= time
+            phase_loads[phase][robot] += time
+
+        robots[plate] = robot
+
+    return undo
+
+
+def main(args):
+    '''main method.'''
+    report = split_dir(args[0], int(args[1]))
+
+    if os.path.exists(os.path.join(args[0], 'manifest.csv')):
+        output.write_manifest(args[0])
+
+    pd.set_option('display.width', 200)
+    print(report.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,24 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+
+
+def optimise(df, by_src=False):
+    '''Optimise, visiting destination (or source) wells column by column,
+    alternating down and up each column.'''
+    prefix = 'src_' if by_src else 'dest_'
+    row = df[prefix + 'row'].where(df[prefix + 'col'] % 2 == 0,
+                                   -df[prefix + 'row'])
+
+    sort_df = df.assign(_serpentine_row=row).sort_values(
+        [prefix + 'plate', prefix + 'col', '_serpentine_row'],
+        kind='mergesort')
+
+    return sort_df.drop(columns='_serpentine_row').reset_index(drop=True)
@@ -0,0 +1,366 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import itertools
+import json
+import os
+import queue
+from socketserver import ThreadingMixIn
+import sys
+import threading
+
+from autogenes import optimisers, pipeline, run, validate, worklist
+import pandas as pd
+
+
+_REQUIRED = ['plate_dir', 'max_mutated', 'n_blocks', 'exp_name']
+
+
+class LruCache():
+    '''Thread-safe least-recently-used cache.'''
+
+    def __init__(self, max_size):
+        self.__max_size = max_size
+        self.__values = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, key, func):
+        '''Get value for key, calculating it with func on a miss.'''
+        value = self.find(key)
+
+        if value is None:
+            value = func()
+            self.put(key, value)
+
+        return value
+
+    def find(self, key):
+        '''Find value for key, or None on a miss.'''
+        with self.__lock:
+            if key in self.__values:
+                self.__hits += 1
+                self.__values.move_to_end(key)
+                return self.__values[key]
+
+            self.__misses += 1
+            return None
+
+    def put(self, key, value):
+        '''Put value for key.'''
+        with self.__lock:
+            self.__values[key] = value
+            self.__values.move_to_end(key)
+
+            while len(self.__values) > self.__max_size:
+                self.__values.popitem(last=False)
+
+    def clear(self):
+        '''Clear cache.'''
+        with self.__lock:
+            self.__values.clear()
+
+    def get_stats(self):
+        '''Get hit, miss and size statistics.'''
+        with self.__lock:
+            return {'size': len(self.__values),
+                    'max_size': self.__max_size,
+                    'hits': self.__hits,
+                    'misses': self.__misses}
+
+
+class WorklistService():
+    '''Class to generate worklists, keeping input plates, designs and stage
+    results warm between requests.'''
+
+    def __init__(self, max_workers=2, plates_size=8, designs_size=16,
+                 results_size=32):
+        self.__executor = ThreadPoolExecutor(max_workers)
+        self.__caches = OrderedDict([
+            ('plates', LruCache(plates_size)),
+            ('designs', LruCache(designs_size)),
+            ('results', LruCache(results_size))])
+
+    def submit(self, params):
+        '''Submit a run request, returning a future of its stages.'''
+        return self.__executor.submit(self.run, params)
+
+    def stream(self, params):
+        '''Submit a run request, returning an iterator of its stages, each
+        available as soon as it is run.'''
+        stages = queue.Queue()
+
+        def _run():
+            try:
+                for stage in self.iter_run(params):
+                    stages.put((stage, None))
+
+                stages.put((None, None))
+            except Exception as err:  # pylint: disable=broad-except
+                stages.put((None, err))
+
+        self.__executor.submit(_run)
+
+        while True:
+            stage, err = stages.get()
+
+            if err:
+                raise err
+
+            if stage is None:
+                return
+
+            yield stage
+
+    def run(self, params):
+        '''Run request, returning a list of stages.'''
+        return list(self.iter_run(params))
+
+    def iter_run(self, params):
+        '''Run request, yielding each stage as it is run, and caching the
+        result once all have been.'''
+        missing = [name for name in _REQUIRED if name not in params]
+
+        if missing:
+            raise ValueError('Missing parameter(s): ' + ', '.join(missing))
+
+        plate_dir = params['plate_dir']
+        max_mutated = int(params['max_mutated'])
+        n_blocks = int(params['n_blocks'])
+        exp_name = params['exp_name']
+        working_vol = float(params['working_vol']) \
+            if params.get('working_vol') is not None else None
+        optimiser = params.get('optimiser', 'smart_sort')
+        combined = bool(params.get('combined', False))
+        min_vol = float(params.get('min_vol', 0.5))
+        min_reactions = bool(params.get('min_reactions', False))
+        n_samples = int(params['sample']) \
+            if params.get('sample') is not None else None
+        seed = int(params.get('seed', 0))
+
+        if len(exp_name) > 5:
+            raise ValueError('exp_name must be at most 5 characters')
+
+        plates_key = _get_plates_key(plate_dir)
+        designs_key = (plates_key, max_mutated, n_blocks, 1, min_reactions,
+                       n_samples, seed)
+        key = designs_key + (exp_name, working_vol, optimiser, combined,
+                             min_vol)
+
+        stages = self.__caches['results'].find(key)
+
+        if stages is not None:
+            yield from stages
+            return
+
+        stages = []
+
+        for stage in self.__run(plates_key, designs_key, exp_name,
+                                working_vol, optimiser, combined, min_vol):
+            stages.append(stage)
+            yield stage
+
+        self.__caches['results'].put(key, stages)
+
+    def clear(self):
+        '''Clear caches.'''
+        for cache in self.__caches.values():
+            cache.clear()
+
+    def get_stats(self):
+        '''Get cache statistics.'''
+        return {name: cache.get_stats()
+                for name, cache in self.__caches.items()}
+
+    def close(self):
+        '''Shutdown worker pool.'''
+        self.__executor.shutdown()
+
+    def __run(self, plates_key, designs_key, exp_name, working_vol,
+              optimiser, combined, min_vol):
+        '''Run pipeline in memory, yielding each stage as it is run.'''
+        input_plates = self.__caches['plates'].get(
+            plates_key, lambda: pipeline.get_input_plates(plates_key[0]))
+
+        oligos, mutant_oligos, primers, designs = self.__caches['designs'].get(
+            designs_key,
+            lambda: run.get_designs(input_plates, *designs_key[1:]))
+
+        writers = run.get_writers(oligos, mutant_oligos, primers, designs,
+                                  exp_name)
+        validate.check(validate.validate_writers(writers, min_vol))
+
+        # Copy cached plates, as the pipeline adds plates to them (placement
+        # itself works on copies of each plate):
+        stages = pipeline.iter_run(
+            writers,
+            dict(input_plates),
+            parent_out_dir_name=None,
+            working_vol=working_vol,
+            io_workers=0,
+            optimiser=optimisers.get_optimiser(optimiser),
+            combined=combined)
+
+        for stage in stages:
+            yield _to_dict(stage)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    '''Threaded HTTP server, holding the service.'''
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        HTTPServer.__init__(self, address, _Handler)
+        self.service = service
+
+
+class _Handler(BaseHTTPRequestHandler):
+    '''Handler of JSON requests.'''
+
+    def do_GET(self):
+        '''Handle GET.'''
+        if self.path == '/health':
+            self.__send(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self.__send(200, self.server.service.get_stats())
+        else:
+            self.__send(404, {'error': 'Unknown path: ' + self.path})
+
+    def do_POST(self):
+        '''Handle POST.'''
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length) or '{}')
+
+            if self.path == '/clear':
+                self.server.service.clear()
+                self.__send(200, {'status': 'ok'})
+            elif self.path == '/run':
+                if params.get('stream'):
+                    self.__stream(self.server.service.stream(params))
+                else:
+                    stages = self.server.service.submit(params).result()
+                    self.__send(200, {'stages': stages})
+            else:
+                self.__send(404, {'error': 'Unknown path: ' + self.path})
+        except (KeyError, TypeError, ValueError, IOError) as err:
+            self.__send(400, {'error': _get_error(err)})
+        except Exception as err:  # pylint: disable=broad-except
+            # Any other failure of the pipeline, e.g. an AssertionError:
+            self.__send(500, {'error': _get_error(err)})
+
+    def log_message(self, *args):
+        '''Suppress per-request logging.'''
+
+    def __send(self, status, obj):
+        '''Send JSON response.'''
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __stream(self, stages):
+        '''Stream stages as newline-delimited JSON, one stage per line, as
+        each is run.
+
+        Errors before the first stage are raised; any later error is sent as
+        a final line, {"error": ...}.'''
+        first = next(stages, None)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+
+        try:
+            for stage in itertools.chain([first] if first is not None else [],
+                                         stages):
+                self.wfile.write(json.dumps(stage).encode('utf-8') + b'\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client disconnected:
+            pass
+        except Exception as err:  # pylint: disable=broad-except
+            self.wfile.write(json.dumps({'error': _get_error(err)})
+                             .encode('utf-8') + b'\n')
+
+
+def serve(port=8080, max_workers=2):
+    '''Serve on localhost until interrupted.'''
+    service = WorklistService(max_workers)
+    server = _Server(('127.0.0.1', port), service)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def _get_error(err):
+    '''Get message of an error, naming its type if it has no message.'''
+    return str(err) or type(err).__name__
+
+
+def _get_plates_key(plate_dir):
+    '''Get key of input plates, changing whenever a plate file changes.'''
+    plate_dir = os.path.abspath(plate_dir)
+
+    if not os.path.isdir(plate_dir):
+        raise ValueError('Plate directory not found: ' + plate_dir)
+
+    files = []
+
+    for(dirpath, _, filenames) in os.walk(plate_dir):
+        for filename in sorted(filenames):
+            if filename.endswith('.csv'):
+                stat = os.stat(os.path.join(dirpath, filename))
+                files.append((os.path.join(dirpath, filename),
+                              stat.st_mtime_ns, stat.st_size))
+
+    return plate_dir, tuple(sorted(files))
+
+
+def _to_dict(stage):
+    '''Convert stage to a JSON-serialisable dict.'''
+    return {'name': stage.name,
+            'worklist': _to_records(worklist.format_stage(stage.worklists)),
+            'summary': _to_records(stage.summary),
+            'plates': {name: {well: obj['id']
+                              for well, obj in plt.get_all().items()}
+                       for name, plt in stage.plates.items()}}
+
+
+def _to_records(df):
+    '''Convert DataFrame to records, with missing values as None.'''
+    df = df.astype(object).where(pd.notnull(df), None)
+    return df.to_dict('records')
+
+
+def main(args):
+    '''main method.'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=2,
+                        help='requests run concurrently')
+    args = parser.parse_args(args)
+    serve(args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,190 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+from collections import namedtuple, OrderedDict
+import os
+import sys
+
+from autogenes import plate
+import numpy as np
+import pandas as pd
+
+# Times in seconds; moves cost move_time plus well_time per well travelled.
+CostModel = namedtuple('CostModel', ['channels',
+                                     'move_time',
+                                     'well_time',
+                                     'aspirate_time',
+                                     'dispense_time',
+                                     'vol_time',
+                                     'tip_time',
+                                     'swap_time',
+                                     'deck_plates'])
+
+DEFAULT_MODEL = CostModel(channels=8,
+                          move_time=1.0,
+                          well_time=0.05,
+                          aspirate_time=2.0,
+                          dispense_time=2.0,
+                          vol_time=0.05,
+                          tip_time=8.0,
+                          swap_time=30.0,
+                          deck_plates=4)
+
+_REPORT_COLUMNS = ['transfers', 'batches', 'swaps', 'time']
+
+
+def simulate(df, model=DEFAULT_MODEL):
+    '''Estimate run time of a worklist, per destination plate.
+
+    Consecutive transfers between the same source and destination plates
+    are performed in batches of up to model.channels, each with fresh tips,
+    one move to source, one aspirate, one move to destination and one
+    dispense, the slowest channel determining volume-dependent times.
+    Plates are swapped onto a deck of model.deck_plates positions as
+    needed, least recently used first.'''
+    src_plate, src_row, src_col, dest_plate, dest_row, dest_col, vols = \
+        _get_columns(df)
+
+    n_transfers = len(vols)
+
+    if not n_transfers:
+        return pd.DataFrame(columns=['plate'] + _REPORT_COLUMNS)
+
+    # Batch boundaries, where plates change or channels are used up:
+    plate_change = np.ones(n_transfers, dtype=bool)
+    plate_change[1:] = (src_plate[1:] != src_plate[:-1]) | \
+        (dest_plate[1:] != dest_plate[:-1])
+    run_starts = np.flatnonzero(plate_change)
+    run_idx = np.arange(n_transfers) - \
+        run_starts[np.cumsum(plate_change) - 1]
+    batch_start = run_idx % model.channels == 0
+    batch_ids = np.cumsum(batch_start) - 1
+    starts = np.flatnonzero(batch_start)
+
+    max_vols = np.maximum.reduceat(vols, starts)
+
+    # Moves: previous destination to source, then source to destination:
+    prev_row = np.roll(dest_row[starts], 1)
+    prev_col = np.roll(dest_col[starts], 1)
+    prev_row[0] = 0
+    prev_col[0] = 0
+
+    to_src = np.abs(src_row[starts] - prev_row) + \
+        np.abs(src_col[starts] - prev_col)
+    to_dest = np.abs(dest_row[starts] - src_row[starts]) + \
+        np.abs(dest_col[starts] - src_col[starts])
+
+    batch_times = model.tip_time + \
+        2 * model.move_time + model.well_time * (to_src + to_dest) + \
+        model.aspirate_time + model.dispense_time + \
+        2 * model.vol_time * max_vols
+
+    swaps = _get_swaps(src_plate[run_starts], dest_plate[run_starts],
+                       model.deck_plates)
+    batch_swaps = np.zeros(len(starts), dtype=int)
+    batch_swaps[batch_ids[run_starts]] = swaps
+    batch_times = batch_times + model.swap_time * batch_swaps
+
+    report = pd.DataFrame({'plate': dest_plate[starts],
+                           'transfers': np.bincount(batch_ids),
+                           'batches': 1,
+                           'swaps': batch_swaps,
+                           'time': batch_times})
+
+    return report.groupby('plate', sort=False).sum().reset_index()
+
+
+def simulate_dir(run_dir_name, model=DEFAULT_MODEL):
+    '''Estimate run time of each stage's worklist.csv in a run directory.'''
+    reports = []
+
+    for dirpath, _, filenames in sorted(os.walk(run_dir_name)):
+        if 'worklist.csv' in filenames:
+            report = simulate(pd.read_csv(os.path.join(dirpath,
+                                                       'worklist.csv')),
+                              model)
+            report.insert(0, 'stage', os.path.relpath(dirpath,
+                                                      run_dir_name))
+            reports.append(report)
+
+    if not reports:
+        return pd.DataFrame(columns=['stage', 'plate'] + _REPORT_COLUMNS)
+
+    return pd.concat(reports, ignore_index=True)
+
+
+def get_swaps(df, deck_plates=DEFAULT_MODEL.deck_plates):
+    '''Get number of plates loaded onto the deck to run a worklist.'''
+    src_plate, _, _, dest_plate, _, _, _ = _get_columns(df)
+
+    if not len(src_plate):
+        return 0
+
+    plate_change = np.ones(len(src_plate), dtype=bool)
+    plate_change[1:] = (src_plate[1:] != src_plate[:-1]) | \
+        (dest_plate[1:] != dest_plate[:-1])
+
+    return sum(_get_swaps(src_plate[plate_change], dest_plate[plate_change],
+                          deck_plates))
+
+
+def _get_columns(df):
+    '''Get plates, coordinates and volumes from a formatted worklist (as
+    written to worklist.csv) or a generated one.'''
+    if 'SourcePlateWell' in df:
+        src_row, src_col = plate.get_well_indices(df['SourcePlateWell'])
+        dest_row, dest_col = plate.get_well_indices(
+            df['DestinationPlateWell'])
+
+        return df['SourcePlateBarcode'].values, src_row, src_col, \
+            df['DestinationPlateBarcode'].values, dest_row, dest_col, \
+            df['Volume'].values.astype(float)
+
+    return df['src_plate'].values, \
+        df['src_row'].values.astype(int), df['src_col'].values.astype(int), \
+        df['dest_plate'].values, \
+        df['dest_row'].values.astype(int), \
+        df['dest_col'].values.astype(int), \
+        df['Volume'].values.astype(float)
+
+
+def _get_swaps(src_plates, dest_plates, deck_plates):
+    '''Get number of plates loaded for each run of transfers.'''
+    deck = OrderedDict()
+    swaps = []
+
+    for plates in zip(src_plates, dest_plates):
+        loads = 0
+
+        for plt in plates:
+            if plt in deck:
+                deck.move_to_end(plt)
+            else:
+                loads += 1
+                deck[plt] = True
+
+                if len(deck) > max(deck_plates, 2):
+                    deck.popitem(last=False)
+
+        swaps.append(loads)
+
+    return swaps
+
+
+def main(args):
+    '''main method.'''
+    report = simulate_dir(args[0])
+    pd.set_option('display.width', 200)
+    print(report.to_string(index=False))
+    print(report.groupby('stage', sort=False)['time'].sum().to_string())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,47 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+from collections import OrderedDict
+import sys
+
+
+class Store():
+    '''Class to hold bulky properties of objects, e.g. sequences, once, by
+    key, to be shared by plates and their copies.
+
+    String values are interned, such that repeated values are held once.'''
+
+    def __init__(self):
+        self.__values = OrderedDict()
+
+    def add(self, key, obj):
+        '''Add properties of an object.'''
+        for prop, val in obj.items():
+            self.__values.setdefault(prop, {})[key] = \
+                sys.intern(val) if isinstance(val, str) else val
+
+    def get(self, key):
+        '''Get properties of an object.'''
+        return {prop: vals[key]
+                for prop, vals in self.__values.items()
+                if key in vals}
+
+    def get_properties(self):
+        '''Get properties.'''
+        return list(self.__values)
+
+    def get_values(self, prop):
+        '''Get values of a property, by key.'''
+        return dict(self.__values.get(prop, {}))
+
+    def __len__(self):
+        return len({key
+                    for vals in self.__values.values()
+                    for key in vals})
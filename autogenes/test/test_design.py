@@ -0,0 +1,56 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+# pylint: disable=protected-access
+import unittest
+
+from autogenes import design, get_design_id
+
+
+class Test(unittest.TestCase):
+    '''Test class for design.'''
+
+    def test_sample_designs(self):
+        '''Tests sample_designs.'''
+        oligos = [str(idx) for idx in range(1, 9)]
+        designs = design.sample_designs(oligos, ['2', '5', '7'], 2, 5,
+                                        design.get_block_lengths(8, 2))
+
+        self.assertEqual(len(designs), 5)
+        self.assertEqual(len({get_design_id(des) for des in designs}), 5)
+
+    def test_sample_designs_max_mutated(self):
+        '''Tests sample_designs, with max_mutated above the number of
+        mutable oligos.'''
+        oligos = [str(idx) for idx in range(1, 9)]
+        mutable = ['2', '5', '7']
+        block_lengths = design.get_block_lengths(8, 2)
+
+        for n_samples in range(1, 10):
+            designs = design.sample_designs(oligos, mutable, 4, n_samples,
+                                            block_lengths)
+            design_ids = {get_design_id(des) for des in designs}
+
+            # At most every design, of up to 3 mutated oligos:
+            self.assertEqual(len(designs), min(n_samples, 8))
+            self.assertEqual(len(design_ids), len(designs))
+
+    def test_allocate(self):
+        '''Tests _allocate, with empty strata.'''
+        self.assertEqual(design._allocate([1, 3, 3, 1, 0], 6),
+                         [1, 2, 2, 1, 0])
+        self.assertEqual(design._allocate([1, 100, 0, 0], 50),
+                         [1, 49, 0, 0])
+        self.assertEqual(design._allocate([1, 3, 3, 1, 0], 20),
+                         [1, 3, 3, 1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import unittest
+
+from autogenes import dispense, worklist
+import pandas as pd
+
+
+class Test(unittest.TestCase):
+    '''Test class for dispense.'''
+
+    def test_consolidate(self):
+        '''Tests consolidate.'''
+        df = dispense.consolidate(_get_df([20, 20, 20]), 50)
+
+        self.assertEqual(list(df['Aspirate']), [1, 1, 2])
+        self.assertEqual(list(df['AspirateVolume']), [40, 40, 20])
+
+    def test_consolidate_oversize(self):
+        '''Tests consolidate splits transfers larger than max_vol.'''
+        df = dispense.consolidate(_get_df([180, 10, 250.5]), 100)
+
+        self.assertEqual(list(df['Volume']), [90, 90, 10, 83.5, 83.5, 83.5])
+        self.assertEqual(list(df['DestinationPlateWell']),
+                         ['A1', 'A1', 'A2', 'A3', 'A3', 'A3'])
+        self.assertEqual(list(df['Aspirate']), [1, 2, 2, 3, 4, 5])
+        self.assertTrue((df['AspirateVolume'] <= 100).all())
+        self.assertEqual(df['Volume'].sum(), 440.5)
+
+    def test_consolidate_max_vol(self):
+        '''Tests consolidate rejects a max_vol that is not positive.'''
+        self.assertRaises(ValueError, dispense.consolidate,
+                          _get_df([20]), 0)
+
+
+def _get_df(vols):
+    '''Get transfers of water, from one well, to consecutive wells.'''
+    return pd.DataFrame({'Volume': vols,
+                         'SourcePlateBarcode': worklist.REAGENT_PLATE,
+                         'SourcePlateWell': 'A1',
+                         'DestinationPlateBarcode': 'output',
+                         'DestinationPlateWell': ['A%d' % (idx + 1)
+                                                  for idx
+                                                  in range(len(vols))],
+                         'ComponentName': 'water'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+# pylint: disable=protected-access
+import unittest
+
+from autogenes import adaptive_opt, plate, smart_sort_opt, worklist
+import pandas as pd
+
+
+class Test(unittest.TestCase):
+    '''Test class for worklist.'''
+
+    def test_optimise_adaptive(self):
+        '''Tests optimise, with the adaptive optimiser ordering transfers
+        differently from smart_sort, with less head travel.'''
+        df = _get_df(['A1', 'A1', 'A1', 'H12'], ['A1', 'H12', 'A2', 'B1'])
+        smart_df = worklist.optimise(df, smart_sort_opt, None)
+        adaptive_df = worklist.optimise(df, adaptive_opt, None)
+
+        self.assertEqual(list(smart_df['dest_well']),
+                         ['A1', 'B1', 'A2', 'H12'])
+        self.assertEqual(list(adaptive_df['dest_well']),
+                         ['A1', 'H12', 'A2', 'B1'])
+        self.assertLess(adaptive_opt.get_travel(adaptive_df),
+                        adaptive_opt.get_travel(smart_df))
+
+    def test_optimise_locations(self):
+        '''Tests optimise passes optimisers location columns only.'''
+        columns = []
+
+        class Optimiser():
+            '''Optimiser recording its input columns.'''
+
+            @staticmethod
+            def optimise(df):
+                '''Optimise, reversing order.'''
+                columns.append(list(df.columns))
+                return df.iloc[::-1]
+
+        df = _get_df(['A1', 'B1'], ['A1', 'A2'])
+        optimised_df = worklist.optimise(df, Optimiser, None)
+
+        self.assertEqual(columns, [worklist._LOCATION_COLUMNS + ['_row']])
+        self.assertEqual(list(optimised_df['src_name']), ['B1', 'A1'])
+
+
+def _get_df(src_wells, dest_wells):
+    '''Get transfers between an input and output 96 well plate.'''
+    df = pd.DataFrame({'level': 0,
+                       'src_is_reagent': False,
+                       'src_name': src_wells,
+                       'dest_name': dest_wells,
+                       'Volume': 1.0,
+                       'src_plate': 'input',
+                       'src_well': src_wells,
+                       'dest_plate': 'output',
+                       'dest_well': dest_wells})
+
+    for prefix in ['src_', 'dest_']:
+        rows, cols = plate.get_well_indices(df[prefix + 'well'])
+        df[prefix + 'row'] = rows
+        df[prefix + 'col'] = cols
+        df[prefix + 'idx'] = cols * 8 + rows
+        df[prefix + 'plate_size'] = 96
+        df[prefix + 'pipette_idx'] = 0
+
+    return df
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import numpy as np
+import pandas as pd
+
+# Volumes are held as integer nanolitres where this is lossless:
+VOL_SCALE = 1000
+
+_INT_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+class TypedWorklist():
+    '''Class to represent a worklist as a NumPy structured array.
+
+    Names, plates and wells are stored as int32 codes into category tables,
+    integer columns (rows, cols, indices, levels) in the narrowest type that
+    holds them, and float columns as fixed-point integers where exact.'''
+
+    def __init__(self, df, categories=None, dtypes=None, scales=None):
+        if categories is not None:
+            # Internal constructor from an existing array:
+            self.__array = df
+            self.__categories = categories
+            self.__dtypes = dtypes
+            self.__scales = scales
+            return
+
+        self.__categories = {}
+        self.__dtypes = df.dtypes.to_dict()
+        self.__scales = {}
+
+        fields = []
+        values = []
+
+        for col in df.columns:
+            vals, dtype = self.__encode(col, df[col])
+            fields.append((str(col), dtype))
+            values.append(vals)
+
+        self.__array = np.empty(len(df), dtype=fields)
+
+        for (field, _), vals in zip(fields, values):
+            self.__array[field] = vals
+
+    def __len__(self):
+        return len(self.__array)
+
+    def columns(self):
+        '''Get columns.'''
+        return list(self.__dtypes)
+
+    def nbytes(self):
+        '''Get memory used, including category tables.'''
+        return self.__array.nbytes + \
+            sum(int(pd.Series(cats, dtype=object).memory_usage(deep=True))
+                for cats in self.__categories.values())
+
+    def get_codes(self, col):
+        '''Get codes and categories of a coded column.'''
+        return self.__array[col], self.__categories[col]
+
+    def take(self, indices):
+        '''Get worklist of the given rows, sharing category tables.'''
+        return TypedWorklist(self.__array[indices], self.__categories,
+                             self.__dtypes, self.__scales)
+
+    def split(self, col):
+        '''Split into (value, TypedWorklist) pairs by a coded column, in
+        value order, without copying through pandas groupby.'''
+        codes, cats = self.get_codes(col)
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+
+        groups = [(cats[grp_codes[0]], self.take(grp))
+                  for grp, grp_codes in zip(np.split(order, bounds),
+                                            np.split(sorted_codes, bounds))
+                  if len(grp) and grp_codes[0] >= 0]
+
+        return sorted(groups, key=lambda group: group[0])
+
+    def to_df(self):
+        '''Convert to DataFrame, restoring the original dtypes.'''
+        data = {}
+
+        for col, dtype in self.__dtypes.items():
+            vals = self.__array[str(col)]
+
+            if col in self.__categories:
+                cats = np.append(
+                    np.asarray(self.__categories[col], dtype=object), None)
+                vals = cats[vals]
+            elif col in self.__scales:
+                vals = vals / self.__scales[col]
+
+            data[col] = pd.Series(vals, dtype=object
+                                  if col in self.__categories
+                                  else None).astype(dtype)
+
+        return pd.DataFrame(data, columns=list(self.__dtypes))
+
+    def __encode(self, col, series):
+        '''Encode column as narrow values.'''
+        if series.dtype == bool:
+            return series.values, np.bool_
+
+        if pd.api.types.is_integer_dtype(series.dtype):
+            return series.values, _get_int_type(series.values)
+
+        if pd.api.types.is_float_dtype(series.dtype):
+            fixed = np.round(series.values * VOL_SCALE)
+
+            if np.isfinite(fixed).all() and \
+                    np.array_equal(fixed / VOL_SCALE, series.values):
+                self.__scales[col] = VOL_SCALE
+                return fixed, _get_int_type(fixed)
+
+            return series.values, series.dtype
+
+        # Strings and other objects, missing values coded as -1:
+        codes, cats = pd.factorize(series.astype(object), sort=True)
+        self.__categories[col] = cats
+        return codes, np.int32
+
+
+def _get_int_type(values):
+    '''Get narrowest integer type holding values.'''
+    if not len(values):
+        return np.int8
+
+    for int_type in _INT_TYPES:
+        info = np.iinfo(int_type)
+
+        if info.min <= values.min() and values.max() <= info.max:
+            return int_type
+
+    return np.int64
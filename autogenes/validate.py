@@ -0,0 +1,83 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=too-many-arguments
+from autogenes.graph_writer import Violation
+import pandas as pd
+
+
+def validate_inputs(oligos, mutant_oligos, primers, max_mutated, n_blocks,
+                    n_samples=None):
+    '''Get Violations of input oligos and design parameters.'''
+    violations = []
+
+    if n_samples is not None and n_samples < 1:
+        violations.append(Violation('no_samples', 'n_samples', n_samples,
+                                    'Number of designs to sample must be '
+                                    'positive'))
+
+    if len(oligos) % 2:
+        violations.append(Violation('odd_oligos', 'oligos', len(oligos),
+                                    'Number of oligos must be even'))
+
+    if n_blocks < 1 or len(oligos) < 2 * n_blocks:
+        violations.append(Violation('too_many_blocks', 'n_blocks', n_blocks,
+                                    'Each block requires at least 2 oligos'))
+
+    if max_mutated > 0 and not mutant_oligos:
+        violations.append(Violation('no_mutants', 'max_mutated', max_mutated,
+                                    'No mutant oligos to combine'))
+
+    # Mutant oligos, by parent:
+    muts = pd.Series(dict(mutant_oligos), dtype=object).explode().dropna()
+    missing = muts[~muts.index.isin(list(oligos))]
+
+    violations.extend([Violation('missing_parent', mut_id, parent,
+                                 'Parent is not a wild-type oligo')
+                       for parent, mut_id in missing.items()])
+
+    # Mutant oligos may share ids, as they are pooled by parent:
+    counts = pd.Series(list(oligos) + list(primers),
+                       dtype=object).value_counts(sort=False)
+
+    violations.extend([Violation('duplicate_id', oligo_id, int(count),
+                                 'Oligo id is used more than once')
+                       for oligo_id, count in counts[counts > 1].items()])
+
+    return violations
+
+
+def validate_extension(previous, n_blocks):
+    '''Get Violations of design parameters against the design ids of a run
+    being extended.'''
+    return [Violation('block_mismatch', design_id, design_id.count('-') + 1,
+                      'Design of a run being extended has a different '
+                      'number of blocks')
+            for design_id in previous[:1]
+            if design_id.count('-') + 1 != n_blocks]
+
+
+def validate_writers(writers, min_vol):
+    '''Get Violations of writer parameters.'''
+    return [violation
+            for writer in writers
+            for violation in writer.get_violations(min_vol)]
+
+
+def to_df(violations):
+    '''Get report of Violations.'''
+    return pd.DataFrame(violations, columns=Violation._fields)
+
+
+def check(violations):
+    '''Raise ValueError reporting all Violations, if any.'''
+    if violations:
+        raise ValueError('%d violation(s):\n%s' %
+                         (len(violations),
+                          to_df(violations).to_string(index=False)))
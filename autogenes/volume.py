@@ -0,0 +1,101 @@
+'''
+AutoGenes (c) University of Liverpool 2019
+
+AutoGenes is licensed under the MIT License.
+
+To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
+
+@author: neilswainston
+'''
+# pylint: disable=invalid-name
+import numpy as np
+
+NL_PER_UL = 1000
+
+# Smallest volume, in nanolitres, the liquid handler can transfer:
+RESOLUTION = 1
+
+
+class Volume(int):
+    '''Class to represent a volume as integer nanolitres.
+
+    Sums, differences and integer multiples of Volumes are exact, and
+    remain Volumes.'''
+
+    @classmethod
+    def from_ul(cls, vol, resolution=RESOLUTION):
+        '''Get Volume from microlitres, rounded half up to resolution.'''
+        return cls(to_nl(vol, resolution))
+
+    def to_ul(self):
+        '''Get volume in microlitres, as an int if whole.'''
+        return to_ul(int(self))
+
+    def scale(self, numerator, denominator, resolution=RESOLUTION):
+        '''Get Volume multiplied by numerator / denominator, rounded half up
+        to resolution.'''
+        step = denominator * resolution
+        return Volume((2 * int(self) * numerator + step) // (2 * step) *
+                      resolution)
+
+    def __add__(self, other):
+        if not isinstance(other, int):
+            return NotImplemented
+
+        return Volume(int(self) + int(other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if not isinstance(other, int):
+            return NotImplemented
+
+        return Volume(int(self) - int(other))
+
+    def __rsub__(self, other):
+        if not isinstance(other, int):
+            return NotImplemented
+
+        return Volume(int(other) - int(self))
+
+    def __mul__(self, other):
+        if not isinstance(other, int) or isinstance(other, Volume):
+            return NotImplemented
+
+        return Volume(int(self) * other)
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Volume(-int(self))
+
+    def __repr__(self):
+        return 'Volume(%d nl)' % self
+
+
+def to_nl(vols, resolution=RESOLUTION):
+    '''Convert microlitres (a scalar or array) to integer nanolitres, rounded
+    half up to resolution.
+
+    Values are first rounded to 6 decimal places of resolution, such that
+    floating point error does not affect rounding.'''
+    steps = np.round(np.asarray(vols, dtype=float) * NL_PER_UL / resolution,
+                     6)
+    nls = (np.floor(steps + 0.5) * resolution).astype(np.int64)
+    return int(nls) if nls.ndim == 0 else nls
+
+
+def to_ul(nls):
+    '''Convert integer nanolitres (a scalar or array) to microlitres.
+
+    Whole scalar volumes are ints, such that they are written as such, e.g.
+    25 rather than 25.0.'''
+    nls = np.asarray(nls, dtype=np.int64)
+
+    if nls.ndim:
+        return nls / NL_PER_UL
+
+    if nls % NL_PER_UL:
+        return float(nls / NL_PER_UL)
+
+    return int(nls // NL_PER_UL)
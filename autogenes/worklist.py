@@ -16,18 +16,25 @@ To view a copy of this license, visit <http://opensource.org/licenses/MIT/>.
 # pylint: disable=unsubscriptable-object
 # pylint: disable=wrong-import-order
 from collections import defaultdict
+import importlib
+from multiprocessing import Pool, shared_memory
 from operator import itemgetter
 import os
 import re
 
-from scipy.spatial.distance import cityblock
 from synbiochem.utils.graph_utils import get_roots
 
-from autogenes import plate, smart_sort_opt
+from autogenes import plate, smart_sort_opt, volume
+from autogenes.graph_writer import Violation
+from autogenes.typed_worklist import TypedWorklist
+import numpy as np
 import pandas as pd
 
+# Name of reagent plate (trough) in formatted worklists:
+REAGENT_PLATE = 'MastermixTrough'
+
 _VALUES_RENAME = {('src_plate', 'dest_plate'):
-                  {('reagents'): 'MastermixTrough'}}
+                  {('reagents'): REAGENT_PLATE}}
 
 _COLUMNS_RENAME = {'src_name': 'ComponentName',
                    'src_plate': 'SourcePlateBarcode',
@@ -35,6 +42,24 @@ _COLUMNS_RENAME = {'src_name': 'ComponentName',
                    'dest_plate': 'DestinationPlateBarcode',
                    'dest_well': 'DestinationPlateWell'}
 
+_LOCATION_COLUMNS = ['src_plate',
+                     'src_well',
+                     'src_idx',
+                     'src_row',
+                     'src_col',
+                     'src_plate_size',
+                     'src_pipette_idx',
+                     'dest_plate',
+                     'dest_well',
+                     'dest_idx',
+                     'dest_row',
+                     'dest_col',
+                     'dest_plate_size',
+                     'dest_pipette_idx']
+
+# Minimum transfers optimised in parallel:
+PARALLEL_THRESHOLD = 100000
+
 _COLUMNS_ORDER = ['Volume',
                   'SourcePlateBarcode',
                   'SourcePlateWell',
@@ -46,49 +71,101 @@ _COLUMNS_ORDER = ['Volume',
 class WorklistGenerator():
     '''Class to generate worklists.'''
 
-    def __init__(self, graph):
+    def __init__(self, graph, replicates=None, drawn_vols=None,
+                 optimiser=smart_sort_opt, existing=None, added_comps=None,
+                 parallel_threshold=PARALLEL_THRESHOLD):
         self.__graph = graph
+        self.__optimiser = optimiser
+        self.__parallel_threshold = parallel_threshold
+        self.__existing = existing if existing else set()
+        self.__replicates = replicates if replicates else {}
+        self.__shared_vols = drawn_vols if drawn_vols is not None \
+            else defaultdict(int)
+        self.__shared_comps = added_comps if added_comps is not None else {}
+        self.__edges = None
+        self.__base = None
+        self.__placements = {}
         self.__worklist = None
-        self.__input_plates = {}
-        self.__plate_names = {'reagents': 'reagents',
-                              'output': 'output'}
-        self.__added_comps = {}
+        self.__input_plates = None
+        self.__plate_names = None
+        self.__drawn_vols = None
+        self.__added_comps = None
+        self.__wells = None
 
     def get_worklist(self, input_plates=None, plate_names=None):
-        '''Gets worklist and required plates.'''
-        required_plates = {}
+        '''Gets worklist and required plates.
+
+        Placements are made on copies of the input plates, and memoised on
+        the versions of the input plates and the plate names, so repeating a
+        query returns the same result without repeating any graph work,
+        while any change to the plates gives a new placement.'''
+        key = _get_signature(input_plates, plate_names)
 
-        if not self.__worklist:
-            self.__create_worklist(input_plates, plate_names)
+        if key not in self.__placements:
+            self.__placements[key] = self.__create_worklist(input_plates,
+                                                            plate_names)
 
+        typed_worklist, plates = self.__placements[key]
+        required_plates = {}
         worklists = []
 
-        for dest_plate, worklist in self.__worklist.groupby('dest_plate'):
+        for dest_plate, typed_wrklst in typed_worklist.split('dest_plate'):
+            worklist = typed_wrklst.to_df()
             worklist.name = dest_plate
             worklists.append(worklist)
-            required_plates[dest_plate] = self.__input_plates[dest_plate]
-            required_plates.update({nme: self.__input_plates[nme]
+            required_plates[dest_plate] = plates[dest_plate]
+            required_plates.update({nme: plates[nme]
                                     for nme in worklist['src_plate'].unique()})
 
         return worklists, required_plates
 
     def __create_worklist(self, input_plates, plate_names):
         '''Creates worklist and plates.'''
-        data = []
-
-        if input_plates:
-            self.__input_plates.update(input_plates)
+        if self.__base is None:
+            # Component locations and volumes drawn before this generator
+            # placed anything, from which every placement starts:
+            self.__base = (dict(self.__shared_comps),
+                           dict(self.__shared_vols))
+
+        self.__input_plates = {name: plt.copy()
+                               for name, plt in (input_plates or {}).items()}
+        self.__plate_names = {'reagents': 'reagents',
+                              'output': 'output'}
 
         if plate_names:
             self.__plate_names.update(plate_names)
 
-        for root in get_roots(self.__graph):
-            self.__traverse(root, 0, data)
+        self.__added_comps = dict(self.__base[0])
+        self.__drawn_vols = defaultdict(int, self.__base[1])
 
-        self.__worklist = pd.DataFrame(data)
+        edges = self.__get_edges()
 
-        self.__write_input_plates()
-        self.__add_locations()
+        if edges.empty:
+            # Nothing to do, e.g. when extending a library:
+            self.__worklist = TypedWorklist(
+                pd.DataFrame(columns=['src_plate', 'dest_plate']))
+        else:
+            self.__worklist = edges.copy()
+            self.__write_input_plates()
+            self.__add_locations()
+
+        self.__shared_comps.update(self.__added_comps)
+        self.__shared_vols.update(self.__drawn_vols)
+
+        return self.__worklist, self.__input_plates
+
+    def __get_edges(self):
+        '''Get edge table from traversing the graph, memoised as it is
+        independent of placement.'''
+        if self.__edges is None:
+            data = []
+
+            for root in get_roots(self.__graph):
+                self.__traverse(root, 0, data)
+
+            self.__edges = pd.DataFrame(data)
+
+        return self.__edges
 
     def __write_input_plates(self):
         '''Writes input_plates from worklist.'''
@@ -148,70 +225,114 @@ class WorklistGenerator():
 
     def __add_locations(self):
         '''Add locations to worklist.'''
-        locations = self.__worklist.apply(lambda row: self.__get_location(
-            row['src_name'], row['dest_name']), axis=1)
-
-        loc_df = locations.apply(pd.Series)
-        loc_df.index = self.__worklist.index
-        loc_df.columns = ['src_plate',
-                          'src_well',
-                          'src_idx',
-                          'src_row',
-                          'src_col',
-                          'src_plate_size',
-                          'src_pipette_idx',
-                          'dest_plate',
-                          'dest_well',
-                          'dest_idx',
-                          'dest_row',
-                          'dest_col',
-                          'dest_plate_size',
-                          'dest_pipette_idx']
-
-        self.__worklist = optimise(pd.concat([self.__worklist, loc_df],
-                                             axis=1))
-
-    def __get_location(self, src_name, dest_name):
-        '''Get location.'''
-        srcs = self.__added_comps[src_name]
-        dests = self.__added_comps[dest_name]
-
-        shortest_dist = float('inf')
-        opt_pair = None
-
-        for src_plt, src_wells in srcs.items():
-            for dest_plt, dest_wells in dests.items():
-                for src_well in src_wells:
-                    for dest_well in dest_wells:
-                        src_ind = plate.get_indices(src_well)
-                        dest_ind = plate.get_indices(dest_well)
-                        dist = cityblock(src_ind, dest_ind)
-
-                        if dist < shortest_dist:
-                            src_idx = self.__input_plates[src_plt].get_idx(
-                                *src_ind)
-                            dest_idx = self.__input_plates[dest_plt].get_idx(
-                                *dest_ind)
-
-                            shortest_dist = dist
-                            opt_pair = [src_plt, src_well, src_idx,
-                                        *plate.get_indices(src_well),
-                                        *self.__get_pipette_idx(src_plt,
-                                                                src_idx),
-                                        dest_plt, dest_well, dest_idx,
-                                        *plate.get_indices(dest_well),
-                                        *self.__get_pipette_idx(dest_plt,
-                                                                dest_idx)]
-        return opt_pair
+        self.__wells = {}
+
+        locations = [self.__get_locations(src_name, dest_name, vol)
+                     for src_name, dest_name, vol
+                     in self.__worklist[['src_name',
+                                         'dest_name',
+                                         'Volume']].values]
+
+        # Transfers into replicated components are repeated per replicate:
+        worklist = self.__worklist.loc[self.__worklist.index.repeat(
+            [len(locs) for locs in locations])]
+
+        loc_df = pd.DataFrame([loc for locs in locations for loc in locs],
+                              index=worklist.index,
+                              columns=_LOCATION_COLUMNS)
+
+        self.__worklist = TypedWorklist(
+            optimise(pd.concat([worklist, loc_df], axis=1), self.__optimiser,
+                     self.__parallel_threshold))
+
+    def __get_locations(self, src_name, dest_name, vol):
+        '''Get locations, one per destination replicate.'''
+        dests = self.__get_wells(dest_name)
+
+        if self.__is_replicated(dest_name):
+            return [self.__get_location(src_name,
+                                        [vals[idx:idx + 1] for vals in dests],
+                                        vol)
+                    for idx in range(len(dests[0]))]
+
+        return [self.__get_location(src_name, dests, vol)]
+
+    def __get_location(self, src_name, dests, vol):
+        '''Get location.
+
+        Replicated sources are drawn from the least-used well, with ties
+        broken by distance; otherwise the closest source well is used.
+        Distances between every source and destination well are found as
+        one array.'''
+        src_plts, src_wells, src_rows, src_cols = self.__get_wells(src_name)
+        dest_plts, dest_wells, dest_rows, dest_cols = dests
+
+        # City block distance of each (source, destination) pair:
+        dists = np.abs(src_rows[:, None] - dest_rows[None, :]) + \
+            np.abs(src_cols[:, None] - dest_cols[None, :])
+
+        if self.__is_replicated(src_name):
+            drawn = np.array([self.__drawn_vols[(src_plt, src_well)]
+                              for src_plt, src_well
+                              in zip(src_plts, src_wells)])
+            dists = drawn[:, None] * (dists.max() + 1) + dists
+
+        src, dest = np.unravel_index(np.argmin(dists), dists.shape)
+        src_plt, src_well = src_plts[src], src_wells[src]
+        dest_plt, dest_well = dest_plts[dest], dest_wells[dest]
+        src_ind = int(src_rows[src]), int(src_cols[src])
+        dest_ind = int(dest_rows[dest]), int(dest_cols[dest])
+        src_idx = self.__input_plates[src_plt].get_idx(*src_ind)
+        dest_idx = self.__input_plates[dest_plt].get_idx(*dest_ind)
+
+        self.__drawn_vols[(src_plt, src_well)] += volume.to_nl(vol)
+
+        return [src_plt, src_well, src_idx, *src_ind,
+                *self.__get_pipette_idx(src_plt, src_idx),
+                dest_plt, dest_well, dest_idx, *dest_ind,
+                *self.__get_pipette_idx(dest_plt, dest_idx)]
+
+    def __get_wells(self, component):
+        '''Get plates, wells, rows and columns of a component, as arrays,
+        cached per placement.'''
+        if component not in self.__wells:
+            plt_wells = [(plt, well)
+                         for plt, wells
+                         in self.__added_comps[component].items()
+                         for well in wells]
+            plts = np.array([plt for plt, _ in plt_wells], dtype=object)
+            wells = np.array([well for _, well in plt_wells], dtype=object)
+            self.__wells[component] = (plts, wells,
+                                       *plate.get_well_indices(wells))
+
+        return self.__wells[component]
+
+    def __is_replicated(self, component):
+        '''Is component split across several wells for capacity?'''
+        return self.__replicates.get(component, 1) > 1 and \
+            sum(len(wells)
+                for wells in self.__added_comps[component].values()) > 1
 
     def __get_pipette_idx(self, src_plt, src_idx):
-        '''Get pipetting index (supporting 96 and 384 well plates.'''
+        '''Get pipetting index, the offset of a well from the 9mm pitch of
+        an 8 channel head (0 on 96, 0-1 on 384 and 0-3 on 1536 well
+        plates).'''
         plt = self.__input_plates[src_plt]
-        return plt.size(), src_idx % 2 if plt.size() == 384 else 0
+        rows, _ = plt.shape()
+        return plt.size(), src_idx % max(1, rows // 8)
 
     def __traverse(self, dest, level, data):
         '''Traverse tree.'''
         for src in dest.predecessors():
+            if dest.attributes()['name'] in self.__existing:
+                if src[0].attributes()['name'] in self.__existing:
+                    # Transfer already made in an earlier run:
+                    continue
+
+                raise ValueError('Cannot add %s to %s, made in an earlier '
+                                 'run' % (src[0].attributes()['name'],
+                                          dest.attributes()['name']))
+
             opr = src[1].copy()
 
             for key, val in src[0].attributes().items():
@@ -231,11 +352,13 @@ class WorklistGenerator():
         '''Add component.'''
         if component not in self.__added_comps:
             try:
-                (wells, plt) = plate.add_component({'id': component},
-                                                   plate_id,
-                                                   is_reagent,
-                                                   self.__input_plates,
-                                                   well_name)
+                (wells, plt) = plate.add_component(
+                    {'id': component},
+                    plate_id,
+                    is_reagent,
+                    self.__input_plates,
+                    well_name,
+                    self.__replicates.get(component, 1))
 
                 self.__added_comps[component] = {plt.get_name(): wells}
             except KeyError:
@@ -270,33 +393,236 @@ class WorklistGenerator():
         return new_plate_id
 
 
-def optimise(df, optimiser=smart_sort_opt):
-    '''Optimise.'''
-    optimised_dfs = []
+def _get_signature(input_plates, plate_names):
+    '''Get signature of input plates, by version, and plate names.'''
+    return (tuple(sorted((name, plt.get_version())
+                         for name, plt in (input_plates or {}).items())),
+            tuple(sorted((plate_names or {}).items())))
+
+
+def get_replicates(graphs, working_vol):
+    '''Get number of source wells required per component, such that the
+    total volume drawn from any well does not exceed working_vol.
+
+    Each transfer from a replicated component is drawn from its least-drawn
+    well, which cannot take a transfer only if every well has been drawn
+    more than working_vol less that transfer. Wells are added, from the
+    volume of each transfer, until this cannot happen, up to one well per
+    transfer. Transfers larger than working_vol, and input components,
+    whose wells cannot be replicated, are reported by
+    get_working_vol_violations.
+
+    Graphs are given in pipeline order, so components made in one stage
+    and consumed in later ones are sized for all of their transfers.'''
+    return _get_draws(graphs, volume.to_nl(working_vol))[0]
+
+
+def get_working_vol_violations(graphs, working_vol):
+    '''Get Violations of working_vol: transfers larger than it, and input
+    components, held in the single wells of input plates, drawn more than
+    it in total, including once per replicate of the components made from
+    them.'''
+    _, draws, inputs = _get_draws(graphs, volume.to_nl(working_vol))
+    working_nl = volume.to_nl(working_vol)
+    violations = []
+
+    for name, nls in draws.items():
+        violations.extend([Violation('above_working_volume', name,
+                                     volume.to_ul(nl),
+                                     'Transfer volume is above working '
+                                     'volume %s' % working_vol)
+                           for nl in sorted(set(nls))
+                           if nl > working_nl])
+
+        if name in inputs and sum(nls) > working_nl:
+            violations.append(Violation('overdrawn_input', name,
+                                        volume.to_ul(sum(nls)),
+                                        'Input well is drawn above working '
+                                        'volume %s' % working_vol))
+
+    return violations
+
+
+def _get_draws(graphs, working_nl):
+    '''Get number of source wells per component, nanolitres of each
+    transfer drawn from each component, and input components, those never
+    made nor reagents.'''
+    replicates = {}
+    draws = defaultdict(list)
+    made = set()
+    reagents = set()
+
+    for graph in reversed(graphs):
+        consumers = defaultdict(list)
+        visited = set()
+        stack = list(get_roots(graph))
+
+        while stack:
+            vertex = stack.pop()
+
+            for src, attributes in vertex.predecessors():
+                consumers[src].append((vertex, attributes))
+                made.add(vertex.attributes()['name'])
+
+                if src.attributes()['is_reagent']:
+                    reagents.add(src.attributes()['name'])
+
+                if src not in visited:
+                    visited.add(src)
+                    stack.append(src)
+
+        # Size consumers before the components they draw from:
+        for vertex in _get_consumer_order(consumers):
+            name = vertex.attributes()['name']
+
+            for dest, attributes in consumers[vertex]:
+                draws[name].extend([volume.to_nl(attributes['Volume'])] *
+                                   replicates.get(dest.attributes()['name'],
+                                                  1))
+
+            replicates[name] = _get_n_wells(draws[name], working_nl)
+
+    return replicates, draws, set(draws) - made - reagents
+
+
+def _get_n_wells(nls, working_nl):
+    '''Get number of wells from which transfers of nls, each drawn from the
+    least-drawn well, never take a well above working_nl.'''
+    total = sum(nls)
+    largest = max(nls)
+
+    if total <= working_nl:
+        return 1
+
+    if largest >= working_nl:
+        return len(nls)
+
+    return min(len(nls), -(-(total - largest) // (working_nl - largest)))
+
+
+def optimise(df, optimiser=smart_sort_opt,
+             parallel_threshold=PARALLEL_THRESHOLD, n_procs=None):
+    '''Optimise.
+
+    Groups of transfers are ordered independently, from their locations, in
+    a pool of n_procs processes (by default, one per CPU) if there are at
+    least parallel_threshold transfers. Results are identical either way.'''
     cols = ['level',
             'src_is_reagent',
             # 'src_plate',
             'dest_plate']
 
+    group_dfs = list(_get_groups(df, cols))
+    locations = _get_locations(group_dfs)
+    bounds = np.cumsum([0] + [len(group_df) for group_df in group_dfs])
+    n_procs = n_procs or os.cpu_count() or 1
+
+    if parallel_threshold is not None and len(df) >= parallel_threshold \
+            and n_procs > 1 and len(group_dfs) > 1:
+        orders = _get_orders_parallel(locations, bounds, optimiser, n_procs)
+    else:
+        orders = [_get_order(locations.iloc[start:stop], optimiser)
+                  for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    optimised_df = pd.concat([group_df.iloc[order].reset_index(drop=True)
+                              for group_df, order in zip(group_dfs, orders)])
+
+    return optimised_df.sort_values(cols,
+                                    ascending=[False, False, True])
+
+
+def _get_groups(df, cols):
+    '''Get independently optimised groups of transfers, splitting reagents
+    by name.'''
     for _, group_df in df.groupby(cols):
         if group_df['src_is_reagent'].all():
-            group_df = group_df.copy()
-            group_df.loc[:, 'src_name'] = pd.Categorical(group_df['src_name'],
-                                                         ['water',
-                                                          'buffer', 'ladder',
-                                                          'mm', 'mm_dig',
-                                                          'mm_lcr',
-                                                          'ampligase'])
-            for _, subgroup_df in group_df.groupby('src_name'):
+            src_names = pd.Categorical(group_df['src_name'],
+                                       ['water',
+                                        'buffer', 'ladder',
+                                        'mm', 'mm_dig',
+                                        'mm_lcr',
+                                        'ampligase'])
+
+            for _, subgroup_df in group_df.groupby(src_names):
                 if not subgroup_df.empty:
-                    optimised_dfs.append(optimiser.optimise(subgroup_df))
+                    yield subgroup_df
         else:
-            optimised_dfs.append(optimiser.optimise(group_df))
+            yield group_df
 
-    optimised_df = pd.concat(optimised_dfs)
 
-    return optimised_df.sort_values(cols,
-                                    ascending=[False, False, True])
+def _get_locations(group_dfs):
+    '''Get location columns of groups as integers, with plates and wells
+    coded in sort order.'''
+    locations = pd.concat([group_df[[col for col in _LOCATION_COLUMNS
+                                     if col in group_df]]
+                           for group_df in group_dfs], ignore_index=True)
+
+    for col in locations.columns:
+        if locations[col].dtype == object:
+            locations[col] = pd.factorize(locations[col], sort=True)[0]
+
+    return locations.astype(np.int64)
+
+
+def _get_order(locations, optimiser):
+    '''Get order of a group, by optimising its locations.'''
+    optimised_df = optimiser.optimise(
+        locations.assign(_row=np.arange(len(locations))))
+    return optimised_df['_row'].values
+
+
+def _get_orders_parallel(locations, bounds, optimiser, n_procs):
+    '''Get order of each group in a process pool, sharing locations.'''
+    values = np.ascontiguousarray(locations.values)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+
+    try:
+        np.ndarray(values.shape, dtype=values.dtype,
+                   buffer=shm.buf)[:] = values
+
+        args = [(shm.name, values.shape, list(locations.columns), start,
+                 stop, optimiser.__name__)
+                for start, stop in zip(bounds[:-1], bounds[1:])]
+
+        with Pool(min(n_procs, len(args))) as pool:
+            return pool.map(_get_order_shared, args)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _get_order_shared(args):
+    '''Get order of a group from shared locations.'''
+    name, shape, columns, start, stop, optimiser_name = args
+    shm = shared_memory.SharedMemory(name=name)
+
+    try:
+        values = np.ndarray(shape, dtype=np.int64, buffer=shm.buf)
+        locations = pd.DataFrame(values[start:stop].copy(), columns=columns)
+    finally:
+        shm.close()
+
+    return _get_order(locations, importlib.import_module(optimiser_name))
+
+
+def _get_consumer_order(consumers):
+    '''Order vertices such that each follows all of its consumers.'''
+    ordered = []
+    visited = set()
+
+    def _visit(vertex):
+        if vertex not in visited:
+            visited.add(vertex)
+
+            for dest, _ in consumers.get(vertex, []):
+                _visit(dest)
+
+            ordered.append(vertex)
+
+    for vertex in consumers:
+        _visit(vertex)
+
+    return [vertex for vertex in ordered if vertex in consumers]
 
 
 def to_csv(wrklst, out_dir_name='.'):
@@ -315,10 +641,7 @@ def format_worklist(dir_name):
         for filename in filenames:
             if filename.endswith('worklist.csv'):
                 filepath = os.path.join(dirpath, filename)
-                df = pd.read_csv(filepath)
-                _rename_values(df)
-                _rename_cols(df)
-                df = _reorder_cols(df)
+                df = format_df(pd.read_csv(filepath))
                 # df.to_csv(filepath, encoding='utf-8', index=False)
                 dfs.append(df)
                 dir_dfs[dirpath].append(df)
@@ -333,6 +656,26 @@ def format_worklist(dir_name):
     return dfs
 
 
+def format_stage(wrklsts):
+    '''Format a stage's worklists in memory, as format_worklist.'''
+    if not wrklsts:
+        return pd.DataFrame(columns=_COLUMNS_ORDER + ['dest_name'])
+
+    worklist_df = pd.concat([format_df(wrklst.reset_index(drop=True))
+                             for wrklst in wrklsts])
+
+    return worklist_df[_COLUMNS_ORDER + ['dest_name']]
+
+
+def format_df(df):
+    '''Rename columns and values of a worklist to SYNBIOCHEM-specific
+    headers.'''
+    df = df.copy()
+    _rename_values(df)
+    _rename_cols(df)
+    return _reorder_cols(df)
+
+
 def _rename_values(df):
     '''Rename values.'''
     for columns, replacement in _VALUES_RENAME.items():